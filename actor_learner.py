@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+import numpy as np
+
+from tf_agents.policies import epsilon_greedy_policy
+from tf_agents.policies import py_tf_eager_policy
+from tf_agents.policies import q_policy
+from tf_agents.specs import tensor_spec
+
+# Learner train steps between weight publishes
+PUBLISH_INTERVAL = 20
+# Train steps the learner may get ahead of the oldest weights an actor
+# still plays with, before it waits for the actors to catch up
+MAX_POLICY_LAG = 100
+# Rows sampled per row collected that the rate limiter aims for, and
+# how many samples either side may get ahead by before it waits
+SAMPLES_PER_INSERT = 4.0
+RATE_ERROR_BUFFER = 2_000
+# Rows in the replay store before the learner starts
+MIN_REPLAY_SIZE = 1_000
+
+class Throughput:
+
+    # Counts things done, and the seconds spent waiting on the other side
+
+    def __init__(self):
+        self.count = 0
+        self.waited = 0.0
+        self._started = time.perf_counter()
+
+    @property
+    def rate(self):
+        return self.count / max(time.perf_counter() - self._started, 1e-9)
+
+    def __repr__(self):
+        return f"{self.count} ({self.rate:.1f}/s, waited {self.waited:.1f}s)"
+
+class RateLimiter:
+
+    # Keeps rows sampled by the learner within error_buffer of
+    # samples_per_insert times the rows collected by the actors past the
+    # first min_size. Actors block in insert when they get too far ahead,
+    # the learner in sample when it does, or while there are fewer than
+    # min_size rows.
+
+    def __init__(
+            self, samples_per_insert=SAMPLES_PER_INSERT,
+            error_buffer=RATE_ERROR_BUFFER, min_size=MIN_REPLAY_SIZE):
+
+        self.samples_per_insert = samples_per_insert
+        self.error_buffer = error_buffer
+        self.min_size = min_size
+
+        self.inserts = Throughput()
+        self.samples = Throughput()
+
+        self._condition = threading.Condition()
+        self._closed = False
+
+    def _wait(self, blocked, counter):
+        start = time.perf_counter()
+        with self._condition:
+            while blocked() and not self._closed:
+                self._condition.wait(0.1)
+        counter.waited += time.perf_counter() - start
+
+    def _ahead(self):
+        # The first min_size rows are there before sampling may start, so
+        # only the ones after count towards the rate
+        return self.samples.count - max(
+            self.inserts.count - self.min_size, 0) * self.samples_per_insert
+
+    def insert(self, rows):
+        self._wait(lambda: -self._ahead() > self.error_buffer, self.inserts)
+        with self._condition:
+            self.inserts.count += rows
+            self._condition.notify_all()
+
+    def sample(self, rows):
+        self._wait(
+            lambda: self.inserts.count < self.min_size
+            or self._ahead() + rows > self.error_buffer,
+            self.samples)
+        with self._condition:
+            self.samples.count += rows
+            self._condition.notify_all()
+
+    def close(self):
+        # Lets every waiting thread go, for shutting down
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+class WeightPublisher:
+
+    # Latest weights of the learner's Q network, and the train step they
+    # are from
+
+    def __init__(self, network, step=0):
+        self._lock = threading.Lock()
+        self.publishes = Throughput()
+        self.publish(network, step)
+
+    def publish(self, network, step):
+        weights = network.get_weights()
+        with self._lock:
+            self.version = step
+            self._weights = weights
+        self.publishes.count += 1
+
+    def latest(self):
+        with self._lock:
+            return self.version, self._weights
+
+class Actor(threading.Thread):
+
+    # Plays an epsilon greedy policy on a copy of the learner's Q network
+    # against its own env, and adds every step to its own replay store.
+    # Before each step it takes the newest published weights, if any.
+
+    def __init__(
+            self, env, store, network, publisher, rate_limiter, epsilon,
+            observation_and_action_constraint_splitter=None):
+
+        super().__init__(daemon=True)
+
+        self._env = env
+        self._store = store
+        self._publisher = publisher
+        self._rate_limiter = rate_limiter
+
+        self._network = network.copy(name=f"{network.name}_actor")
+        self._network.create_variables()
+
+        policy = q_policy.QPolicy(
+            tensor_spec.from_spec(env.time_step_spec()),
+            tensor_spec.from_spec(env.action_spec()),
+            q_network=self._network,
+            observation_and_action_constraint_splitter=(
+                observation_and_action_constraint_splitter))
+        policy = epsilon_greedy_policy.EpsilonGreedyPolicy(policy, epsilon)
+        self._policy = py_tf_eager_policy.PyTFEagerPolicy(
+            policy, use_tf_function=True, batch_time_steps=not env.batched)
+
+        self._masked = observation_and_action_constraint_splitter is not None
+        self._batch = env.batch_size if env.batched else None
+
+        self.version = -1
+        self.steps = Throughput()
+        self.pulls = Throughput()
+        self._stopping = threading.Event()
+
+    def stop(self):
+        self._stopping.set()
+
+    def _pull(self):
+        version, weights = self._publisher.latest()
+        if version != self.version:
+            self._network.set_weights(weights)
+            self.version = version
+            self.pulls.count += 1
+
+    def _board(self, time_step):
+        # A copy, as the env writes the next board into the same array
+        observation = time_step.observation
+        if self._masked:
+            observation = observation['observation']
+        return np.array(observation)
+
+    def _add(self, board, time_step, action, next_time_step):
+
+        def batched(value, dtype=None):
+            value = np.asarray(value, dtype=dtype)
+            return value if self._batch else value[None]
+
+        self._store.add(
+            batched(board), batched(time_step.step_type),
+            batched(next_time_step.step_type), batched(action),
+            batched(next_time_step.reward), batched(next_time_step.discount))
+
+    def run(self):
+
+        time_step = self._env.reset()
+
+        while not self._stopping.is_set():
+
+            self._pull()
+
+            action = self._policy.action(time_step).action
+            board = self._board(time_step)
+            next_time_step = self._env.step(action)
+            self._add(board, time_step, action, next_time_step)
+            time_step = next_time_step
+
+            rows = self._batch or 1
+            self.steps.count += rows
+            self._rate_limiter.insert(rows)
+
+    def wait_for(self, version):
+        # Blocks until the actor plays with weights at least version old
+        while self.version < version and self.is_alive() \
+                and not self._stopping.is_set():
+            time.sleep(0.01)
+
+class ActorLearner:
+
+    # Runs actors and tells the learner loop when it may train and when
+    # to publish. The learner calls before_training with the rows it is
+    # about to sample and after_training with its new train step.
+
+    def __init__(
+            self, actors, publisher, rate_limiter,
+            publish_interval=PUBLISH_INTERVAL, max_policy_lag=MAX_POLICY_LAG):
+
+        self.actors = list(actors)
+        self.publisher = publisher
+        self.rate_limiter = rate_limiter
+        self.publish_interval = publish_interval
+        # Actors can't be closer than a publish behind
+        self.max_policy_lag = max(max_policy_lag, publish_interval)
+
+        self.train_steps = Throughput()
+
+    def start(self):
+        for actor in self.actors:
+            actor.start()
+
+    def stop(self):
+        self.rate_limiter.close()
+        for actor in self.actors:
+            actor.stop()
+        for actor in self.actors:
+            actor.join()
+
+    def before_training(self, rows, step):
+        self.rate_limiter.sample(rows)
+        start = time.perf_counter()
+        for actor in self.actors:
+            actor.wait_for(step - self.max_policy_lag)
+        self.train_steps.waited += time.perf_counter() - start
+
+    def after_training(self, network, step, iterations):
+        self.train_steps.count += iterations
+        if step - self.publisher.version >= self.publish_interval:
+            self.publisher.publish(network, step)
+
+    def report(self):
+        versions = [actor.version for actor in self.actors]
+        return (
+            f"learner: steps {self.train_steps}, "
+            f"samples {self.rate_limiter.samples}, "
+            f"publishes {self.publisher.publishes.count}; "
+            f"actors: rows {self.rate_limiter.inserts}, "
+            f"weights from steps {min(versions)}-{max(versions)}")
@@ -2,7 +2,9 @@
 # -*- coding: utf-8 -*-
 
 import os
-import pickle
+import shutil
+import subprocess
+import sys
 
 import tensorflow as tf
 
@@ -12,12 +14,20 @@ from tf_agents.agents.dqn import dqn_agent
 from tf_agents.drivers import dynamic_step_driver, dynamic_episode_driver
 from tf_agents.metrics import tf_metrics
 from tf_agents.networks import q_network
+from tf_agents.policies import greedy_policy
+from tf_agents.policies import q_policy
 from tf_agents.policies import random_tf_policy
 from tf_agents.policies.policy_saver import PolicySaver
 from tf_agents.replay_buffers import tf_uniform_replay_buffer
 from tf_agents.utils import common
 
+import actor_learner
+from encoding import INT32, tf_decode
 from env import PyBattleshipEnv
+from parallel_env import ParallelBattleshipEnv
+from replay import ReplayStore, ShardedReplay
+from saving import BackgroundWriter, StatsLog
+from tf_env import TFBattleshipEnv
 
 NAME = "TEST9"
 
@@ -33,7 +43,30 @@ LOSS_FN = common.element_wise_squared_loss
 BUFFER_MAX_LEN = 100
 BUFFER_BATCH_SIZE = 10
 
+# Keeps experience in a replay.ReplayStore instead: boards packed 2 bits per
+# cell, prioritized sampling and incremental checkpoints of its own, for
+# buffers of millions of transitions
+LOCAL_REPLAY = False
+REPLAY_CAPACITY = 1_000_000
+
+# Collects in NUM_ACTORS threads, each playing its own env with a copy of
+# the collect policy into its own shard of the replay store, while the
+# main thread only trains, see actor_learner.py. Uses the replay store
+# whatever LOCAL_REPLAY says.
+ACTOR_LEARNER = False
+NUM_ACTORS = 2
+PUBLISH_INTERVAL = actor_learner.PUBLISH_INTERVAL
+MAX_POLICY_LAG = actor_learner.MAX_POLICY_LAG
+SAMPLES_PER_INSERT = actor_learner.SAMPLES_PER_INSERT
+RATE_ERROR_BUFFER = actor_learner.RATE_ERROR_BUFFER
+MIN_REPLAY_SIZE = actor_learner.MIN_REPLAY_SIZE
+
 COLLECTION_STEPS = 1
+
+# Processes stepping training environments, and boards played by each.
+# Every collection step gathers one transition per board.
+NUM_COLLECT_WORKERS = os.cpu_count()
+BOARDS_PER_WORKER = 1
 NUM_EVAL_EPISODES = 10
 NUM_TRAINING_ITERATIONS = 20_000
 
@@ -45,27 +78,111 @@ EPSILON_DECAY_STEPS = 18_000 # How many steps the epsilon should decay over
 SKIP_INVALID_ACTIONS = False
 PUNISH_INVALID_ACTIONS = True # Takes precedence over SKIP_INVALID_ACTIONS
 
+# Adds a mask of the cells not shot yet to observations, which the collect,
+# eval and random policies use to never pick an already shot cell
+MASK_INVALID_ACTIONS = True
+
+# Runs the game as TF ops instead of wrapping the Python environment,
+# so the drivers can be compiled end to end
+TF_ENVIRONMENT = False
+
+BOARD_SHAPE = (10, 10)
+
+# How boards are stored in observations (see encoding.py). "uint8" and
+# "planes" boards take 4x and 8x fewer bytes than "int32" ones; the
+# network decodes every encoding into the same one-hot planes
+OBSERVATION_ENCODING = INT32
+
 LOG_INTERVAL = 5 # How often to print progress to console
 EVAL_INTERVAL = 10 # How often to evaluate the agent's performence
 
+# Scores every policy save on EVAL_EPISODES fixed boards in a separate
+# process (see eval_service.py) instead of running the eval driver every
+# EVAL_INTERVAL steps, so training never waits on evaluation
+EVAL_SERVICE = False
+EVAL_EPISODES = 500
+
+# Runs ITERATIONS_PER_CALL iterations of collecting, sampling and training
+# as one compiled function, with the losses kept in a TF variable until the
+# next log, instead of syncing with Python after every iteration. Both
+# intervals above, and NUM_TRAINING_ITERATIONS, must be multiples of
+# ITERATIONS_PER_CALL.
+COMPILED_TRAINING = True
+ITERATIONS_PER_CALL = 5
+
+# Train steps between policy saves and between checkpoints, independent
+# of EVAL_INTERVAL. Both must be multiples of ITERATIONS_PER_CALL.
+POLICY_SAVE_INTERVAL = 50
+CHECKPOINT_INTERVAL = 100
+# Saves waiting for the background writer before training waits for it
+MAX_PENDING_SAVES = 2
+
 # Where to save checkpoints, policies and stats
 SAVE_DIR = os.path.join("..", "TFBattleship_DATA")
 
-train_py_env = PyBattleshipEnv(skip_invalid_actions=SKIP_INVALID_ACTIONS)
-eval_py_env = PyBattleshipEnv(skip_invalid_actions=SKIP_INVALID_ACTIONS)
-
-train_py_env = wrappers.TimeLimit(train_py_env, duration=100)
-eval_py_env = wrappers.TimeLimit(eval_py_env, duration=100)
-
-train_env = tf_py_environment.TFPyEnvironment(train_py_env)
-eval_env = tf_py_environment.TFPyEnvironment(eval_py_env)
+if TF_ENVIRONMENT:
+    train_env = TFBattleshipEnv(
+        skip_invalid_actions=SKIP_INVALID_ACTIONS, duration=100,
+        observe_legal_actions=MASK_INVALID_ACTIONS,
+        shape=BOARD_SHAPE,
+        observation_encoding=OBSERVATION_ENCODING)
+    eval_env = TFBattleshipEnv(
+        skip_invalid_actions=SKIP_INVALID_ACTIONS, duration=100,
+        observe_legal_actions=MASK_INVALID_ACTIONS,
+        shape=BOARD_SHAPE,
+        observation_encoding=OBSERVATION_ENCODING)
+
+elif ACTOR_LEARNER:
+    def make_actor_env():
+        return wrappers.TimeLimit(
+            PyBattleshipEnv(
+                skip_invalid_actions=SKIP_INVALID_ACTIONS,
+                observe_legal_actions=MASK_INVALID_ACTIONS,
+                shape=BOARD_SHAPE,
+                observation_encoding=OBSERVATION_ENCODING),
+            duration=100)
+
+    # Only gives the specs, the actors have their own envs
+    train_env = tf_py_environment.TFPyEnvironment(make_actor_env())
+    eval_env = tf_py_environment.TFPyEnvironment(make_actor_env())
+
+else:
+    train_py_env = ParallelBattleshipEnv(
+        NUM_COLLECT_WORKERS, BOARDS_PER_WORKER,
+        skip_invalid_actions=SKIP_INVALID_ACTIONS, duration=100,
+        observe_legal_actions=MASK_INVALID_ACTIONS,
+        shape=BOARD_SHAPE,
+        observation_encoding=OBSERVATION_ENCODING)
+    eval_py_env = PyBattleshipEnv(
+        skip_invalid_actions=SKIP_INVALID_ACTIONS,
+        observe_legal_actions=MASK_INVALID_ACTIONS,
+        shape=BOARD_SHAPE,
+        observation_encoding=OBSERVATION_ENCODING)
+
+    eval_py_env = wrappers.TimeLimit(eval_py_env, duration=100)
+
+    train_env = tf_py_environment.TFPyEnvironment(train_py_env)
+    eval_env = tf_py_environment.TFPyEnvironment(eval_py_env)
 
 # Creates a tensor to count the number of training iterations
 train_step_counter = tf.Variable(0)
 
+if MASK_INVALID_ACTIONS:
+    def observation_and_action_constraint_splitter(observation):
+        return observation['observation'], observation['legal_actions']
+
+    board_spec = train_env.observation_spec()['observation']
+else:
+    observation_and_action_constraint_splitter = None
+    board_spec = train_env.observation_spec()
+
+preprocessing_layer = tf.keras.layers.Lambda(
+    lambda board: tf_decode(board, BOARD_SHAPE, OBSERVATION_ENCODING))
+
 q_net = q_network.QNetwork(
-        train_env.observation_spec(), # Passes observation spec,
+        board_spec, # Passes observation spec,
         train_env.action_spec(), # and action spec of environment.
+        preprocessing_layers=preprocessing_layer,
         fc_layer_params=FC_LAYER_PARAMS,
         activation_fn=ACTIVATION_FN
 )
@@ -84,22 +201,60 @@ agent = dqn_agent.DqnAgent(
     optimizer=OPTIMIZER,
     epsilon_greedy=epsilon,
     td_errors_loss_fn=LOSS_FN,
-    train_step_counter=train_step_counter
-)
-
-replay_buffer = tf_uniform_replay_buffer.TFUniformReplayBuffer(
-    data_spec=agent.collect_data_spec,
-    batch_size=train_env.batch_size,
-    max_length=BUFFER_MAX_LEN,
+    train_step_counter=train_step_counter,
+    observation_and_action_constraint_splitter=(
+        observation_and_action_constraint_splitter)
 )
 
-replay_observer = [replay_buffer.add_batch]
-
-dataset = replay_buffer.as_dataset(
-    sample_batch_size=BUFFER_BATCH_SIZE,
-    num_steps = 2,
-    num_parallel_calls=3
-).prefetch(3)
+if ACTOR_LEARNER:
+    LOCAL_REPLAY = True
+
+    replay_buffer = ShardedReplay(
+        ReplayStore(
+            agent.collect_data_spec,
+            1,
+            REPLAY_CAPACITY // NUM_ACTORS,
+            shape=BOARD_SHAPE,
+            encoding=OBSERVATION_ENCODING,
+            directory=os.path.join(
+                SAVE_DIR, NAME + " data", "replay", f"actor {actor}")
+        )
+        for actor in range(NUM_ACTORS)
+    )
+    replay_buffer.restore()
+
+    # Not prefetched, so every batch is drawn right after before_training
+    # let it through: none before MIN_REPLAY_SIZE rows, and all of them
+    # counted by the rate limiter
+    dataset = replay_buffer.as_dataset(BUFFER_BATCH_SIZE, prefetch=0)
+
+elif LOCAL_REPLAY:
+    replay_buffer = ReplayStore(
+        agent.collect_data_spec,
+        train_env.batch_size,
+        REPLAY_CAPACITY,
+        shape=BOARD_SHAPE,
+        encoding=OBSERVATION_ENCODING,
+        directory=os.path.join(SAVE_DIR, NAME + " data", "replay")
+    )
+    replay_buffer.restore()
+
+    dataset = replay_buffer.as_dataset(BUFFER_BATCH_SIZE)
+
+else:
+    replay_buffer = tf_uniform_replay_buffer.TFUniformReplayBuffer(
+        data_spec=agent.collect_data_spec,
+        batch_size=train_env.batch_size,
+        max_length=BUFFER_MAX_LEN,
+    )
+
+    dataset = replay_buffer.as_dataset(
+        sample_batch_size=BUFFER_BATCH_SIZE,
+        num_steps = 2,
+        num_parallel_calls=3
+    ).prefetch(3)
+
+replay_observer = [] if ACTOR_LEARNER else [replay_buffer.add_batch]
 
 dataset_iterator = iter(dataset)
 
@@ -119,7 +274,9 @@ collect_driver = dynamic_step_driver.DynamicStepDriver(
 random_policy_driver = dynamic_step_driver.DynamicStepDriver(
     env=train_env,
     policy=random_tf_policy.RandomTFPolicy(
-        train_env.time_step_spec(), train_env.action_spec()
+        train_env.time_step_spec(), train_env.action_spec(),
+        observation_and_action_constraint_splitter=(
+            observation_and_action_constraint_splitter)
         ),
     observers=replay_observer,
     num_steps=COLLECTION_STEPS
@@ -133,7 +290,23 @@ eval_metrics = [
     avg_return_metric
 ]
 
-policy_saver = PolicySaver(agent.policy)
+# Policies are saved from a copy of the network, which the background
+# writer loads with a snapshot of the weights, so training goes on while
+# a policy is written
+export_q_net = q_net.copy(name="export_q_net")
+export_q_net.create_variables()
+
+policy_saver = PolicySaver(
+    greedy_policy.GreedyPolicy(
+        q_policy.QPolicy(
+            train_env.time_step_spec(),
+            train_env.action_spec(),
+            q_network=export_q_net,
+            observation_and_action_constraint_splitter=(
+                observation_and_action_constraint_splitter)
+        )
+    )
+)
 
 eval_driver = dynamic_episode_driver.DynamicEpisodeDriver(
     env=eval_env,
@@ -142,98 +315,239 @@ eval_driver = dynamic_episode_driver.DynamicEpisodeDriver(
     num_episodes=NUM_EVAL_EPISODES
 )
 
+if TF_ENVIRONMENT:
+    # Nothing leaves the graph, so whole driver runs compile to one function
+    collect_driver.run = common.function(collect_driver.run)
+    random_policy_driver.run = common.function(random_policy_driver.run)
+    eval_driver.run = common.function(eval_driver.run)
+
 train_env.reset()
 eval_env.reset()
 
-final_time_step, _ = collect_driver.run()
-
-# Initial buffer fill using random policy
-for i in range(max(int(BUFFER_MAX_LEN/COLLECTION_STEPS), 1)):
-    # Can alternatively be run with the collection policy like so:
-    # final_time_step, _ = collect_driver.run(final_time_step)
-    final_time_step, _ = random_policy_driver.run(final_time_step)
+if ACTOR_LEARNER:
+    # The actors fill the buffer, the learner waits for MIN_REPLAY_SIZE rows.
+    # The time step only goes through train_iterations unused.
+    final_time_step = train_env.current_time_step()
 
-eval_driver.run()
+else:
+    final_time_step, _ = collect_driver.run()
 
-avg_episode_len = avg_episode_len_metric.result().numpy()
-avg_return = avg_return_metric.result().numpy()
+    # Initial buffer fill using random policy
+    for i in range(max(int(BUFFER_MAX_LEN/COLLECTION_STEPS), 1)):
+        # Can alternatively be run with the collection policy like so:
+        # final_time_step, _ = collect_driver.run(final_time_step)
+        final_time_step, _ = random_policy_driver.run(final_time_step)
 
-episode_lengths = [avg_episode_len]
-returns = [avg_return]
-losses = []
+writer = BackgroundWriter(MAX_PENDING_SAVES)
 
-for metric in eval_metrics:
-    metric.reset()
+# Appended to as training goes, see saving.read_stats to load them
+stats = StatsLog(os.path.join(SAVE_DIR, NAME + " data", "stats"))
 
+# The replay store checkpoints itself, a chunk at a time
 checkpointer = common.Checkpointer(
     ckpt_dir=os.path.join(SAVE_DIR, NAME + " data", "checkpoints"),
     max_to_keep=20,
     agent=agent,
     policy=agent.policy,
-    replay_buffer=replay_buffer,
     global_step=agent.train_step_counter,
-    network=q_net
+    network=q_net,
+    **({} if LOCAL_REPLAY else {"replay_buffer": replay_buffer})
 )
 
+# Variables are copied on the training thread and written in the background
+CHECKPOINT_OPTIONS = tf.train.CheckpointOptions(enable_async=True)
 
-# MAIN TRAINING LOOP
-for _ in range(NUM_TRAINING_ITERATIONS):
+def train_step():
 
-    # Runs collect driver
-    final_time_step, _ = collect_driver.run(final_time_step)
+    # Trains on a sample from the buffer and returns the loss
 
-    # Gets experiance from buffer
-    experience, _ = next(dataset_iterator)
+    experience, info = next(dataset_iterator)
 
-    # Train the agent and get the loss
-    train_loss = agent.train(experience).loss
+    if not LOCAL_REPLAY:
+        return agent.train(experience).loss
 
-    # Save the loss to the losses list
-    losses.append(train_loss.numpy())
+    loss_info = agent.train(experience, weights=info.weights)
+    replay_buffer.tf_update_priorities(info.ids, loss_info.extra.td_error)
 
-    # Gets the number of training steps completed
-    step = agent.train_step_counter.numpy()
+    return loss_info.loss
 
-    # Prints progress to console
-    if step % LOG_INTERVAL == 0:
-        print('step = {0}: loss = {1}'.format(step, train_loss))
+def evaluate(step):
+
+    # Runs evaluation driver
+    eval_driver.run()
+
+    avg_episode_len = avg_episode_len_metric.result().numpy()
+    avg_return = avg_return_metric.result().numpy()
 
-    # Evaluates agent performence
-    if step % EVAL_INTERVAL == 0:
+    print(f'Average episode length: {avg_episode_len}')
 
-        # Runs evaluation driver
-        eval_driver.run()
+    stats.append(
+        "eval", step=int(step), episode_length=float(avg_episode_len),
+        average_return=float(avg_return))
 
-        avg_episode_len = avg_episode_len_metric.result().numpy()
-        avg_return = avg_return_metric.result().numpy()
+    # Resets all metrics
+    for metric in eval_metrics:
+        metric.reset()
 
-        print(f'Average episode length: {avg_episode_len}')
+def export_policy(weights, step):
+    export_q_net.set_weights(weights)
+    path = os.path.join(
+        SAVE_DIR, NAME + " data", "policy saves",
+        NAME + " policy @ " + str(step)
+    )
+    # Written next to its final name and moved there when complete, so the
+    # eval service never loads half a policy
+    policy_saver.save(path + ".partial")
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.replace(path + ".partial", path)
 
-        episode_lengths.append(avg_episode_len)
-        returns.append(avg_return)
+def save(step):
 
-        # Saves agent policy
-        policy_saver.save(
-            os.path.join(
-                SAVE_DIR, NAME + " data", "policy saves",
-                NAME + " policy @ " + str(step)
+    # Stats are written every log, whether or not evaluation runs here
+    if step % LOG_INTERVAL == 0:
+        writer.submit(stats.write, stats.take())
+
+    if step % POLICY_SAVE_INTERVAL == 0:
+        writer.submit(export_policy, q_net.get_weights(), int(step))
+
+    if step % CHECKPOINT_INTERVAL == 0:
+        # Makes a backup of the agent, network etc.
+        checkpointer.save(step, options=CHECKPOINT_OPTIONS)
+        if LOCAL_REPLAY:
+            writer.submit(replay_buffer.checkpoint)
+
+if EVAL_SERVICE:
+    # Watches for policy saves until this process exits
+    eval_service = subprocess.Popen([
+        sys.executable, "eval_service.py", NAME,
+        "--directory", SAVE_DIR,
+        "--episodes", str(EVAL_EPISODES),
+        "--shape", *map(str, BOARD_SHAPE),
+        "--watch", "--learner", str(os.getpid()),
+        *(["--skip-invalid-actions"] if SKIP_INVALID_ACTIONS else [])
+    ])
+else:
+    evaluate(int(agent.train_step_counter.numpy()))
+
+if ACTOR_LEARNER:
+    publisher = actor_learner.WeightPublisher(
+        q_net, int(agent.train_step_counter.numpy()))
+    rate_limiter = actor_learner.RateLimiter(
+        SAMPLES_PER_INSERT, RATE_ERROR_BUFFER, MIN_REPLAY_SIZE)
+
+    actors = actor_learner.ActorLearner(
+        [
+            actor_learner.Actor(
+                make_actor_env(),
+                store,
+                q_net,
+                publisher,
+                rate_limiter,
+                epsilon,
+                observation_and_action_constraint_splitter
             )
-        )
+            for store in replay_buffer.stores
+        ],
+        publisher,
+        rate_limiter,
+        publish_interval=PUBLISH_INTERVAL,
+        max_policy_lag=MAX_POLICY_LAG
+    )
+    actors.start()
+
+if COMPILED_TRAINING:
+
+    for interval in (LOG_INTERVAL, EVAL_INTERVAL, POLICY_SAVE_INTERVAL,
+                     CHECKPOINT_INTERVAL, NUM_TRAINING_ITERATIONS):
+        assert interval % ITERATIONS_PER_CALL == 0
+
+    # Losses since the last log, by train step
+    loss_log = tf.Variable(tf.zeros(LOG_INTERVAL), trainable=False)
+
+    @common.function(autograph=True)
+    def train_iterations(time_step):
+
+        for _ in tf.range(ITERATIONS_PER_CALL):
+
+            if not ACTOR_LEARNER:
+                time_step, _ = collect_driver.run(time_step)
+            train_loss = train_step()
+
+            loss_log.scatter_nd_update(
+                [[(agent.train_step_counter - 1) % LOG_INTERVAL]],
+                [train_loss])
+
+        return time_step
+
+    # Counted here rather than read from train_step_counter, which would
+    # sync with the device
+    step = int(agent.train_step_counter.numpy())
+
+    # MAIN TRAINING LOOP
+    for _ in range(NUM_TRAINING_ITERATIONS // ITERATIONS_PER_CALL):
+
+        if ACTOR_LEARNER:
+            actors.before_training(
+                ITERATIONS_PER_CALL * BUFFER_BATCH_SIZE, step)
+
+        final_time_step = train_iterations(final_time_step)
+        step += ITERATIONS_PER_CALL
+
+        if ACTOR_LEARNER:
+            actors.after_training(q_net, step, ITERATIONS_PER_CALL)
+
+        if step % LOG_INTERVAL == 0:
+            logged = loss_log.numpy()
+            for logged_step, loss in enumerate(
+                    logged, step - LOG_INTERVAL + 1):
+                stats.append("losses", step=logged_step, loss=float(loss))
+            print('step = {0}: loss = {1}'.format(step, logged[-1]))
+            if ACTOR_LEARNER:
+                print(actors.report())
+
+        if step % EVAL_INTERVAL == 0 and not EVAL_SERVICE:
+            evaluate(step)
+
+        save(step)
+
+else:
+
+    # MAIN TRAINING LOOP
+    for _ in range(NUM_TRAINING_ITERATIONS):
+
+        if ACTOR_LEARNER:
+            actors.before_training(
+                BUFFER_BATCH_SIZE, agent.train_step_counter.numpy())
+        else:
+            # Runs collect driver
+            final_time_step, _ = collect_driver.run(final_time_step)
+
+        # Gets experiance from buffer, trains the agent and gets the loss
+        train_loss = train_step()
+
+        # Gets the number of training steps completed
+        step = agent.train_step_counter.numpy()
+
+        stats.append("losses", step=int(step), loss=float(train_loss))
+
+        if ACTOR_LEARNER:
+            actors.after_training(q_net, step, 1)
+
+        # Prints progress to console
+        if step % LOG_INTERVAL == 0:
+            print('step = {0}: loss = {1}'.format(step, train_loss))
+            if ACTOR_LEARNER:
+                print(actors.report())
+
+        # Evaluates agent performence
+        if step % EVAL_INTERVAL == 0 and not EVAL_SERVICE:
+            evaluate(step)
+
+        save(step)
+
+if ACTOR_LEARNER:
+    actors.stop()
 
-        # Runs checkpointer to make a backup of the agent, network etc.
-        checkpointer.save(step)
-
-        # Saves the lists of statistics as a pickled dictionary
-        with open(
-                os.path.join(SAVE_DIR, NAME + " data", NAME + " stats.pkl"),
-                "wb",
-                ) as file:
-            pickle.dump(
-                {"Lengths": episode_lengths,
-                 "Losses": losses},
-                file
-                )
-
-        # Resets all metrics
-        for metric in eval_metrics:
-            metric.reset()
+writer.submit(stats.write, stats.take())
+writer.close()
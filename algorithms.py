@@ -1,398 +1,656 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import functools
+import multiprocessing
+import time
+
 import numpy as np
 
+import profiling
+from analysis import BatchAnalyzer, BoardAnalyzer, free_runs, to_bits
+from board import MISS, SUNK, UNKNOWN
+from cache import LRUCache, board_key
+from endgame import EndgameSolver
+from placement import placement_table
+
 DOWN_RIGHT = 0
 UP_LEFT = 1
 
+# ts.StepType.LAST, compared directly since TimeStep.is_last is slow
+LAST = 2
+
+# How much more a placement covering an open hit counts, per hit covered,
+# so that Density finishes off hit ships before hunting for new ones
+HIT_WEIGHT = 50
+
+# Layouts MonteCarlo draws per move when given no budget
+MONTE_CARLO_SAMPLES = 1000
+# Gives up on a move's sample budget after this many draws per sample,
+# in case the board allows few or no layouts
+MAX_DRAWS_PER_SAMPLE = 20
+
+# Moves Cached remembers by default
+CACHE_SIZE = 100_000
+
+class _Sweep(list):
+    # Cells in visiting order, loop is where to continue after the last one
+    loop = 0
+
+@functools.lru_cache(maxsize=None)
+def diagonal_sweep(shape):
+
+    # Traces the path of Bouncy's cursor, which runs down-right along a
+    # diagonal, bounces back up-left along one 3 cells over, and so on.
+    # Off-board positions are skipped and cells the path never reaches are
+    # appended, so every cell is visited on larger or uneven boards too,
+    # where the bounces can also send the cursor off the board for good.
+
+    rows, cols = shape
+
+    x, y = 1, 0
+    direction = DOWN_RIGHT
+
+    path = []
+    seen = {}
+
+    while (x, y, direction) not in seen and len(seen) < 4 * rows * cols:
+
+        seen[(x, y, direction)] = len(path)
+        if 0 <= x < rows and 0 <= y < cols and (x, y) not in path:
+            path.append((x, y))
+
+        if direction == DOWN_RIGHT:
+            x += 1
+            y += 1
+            if y > cols - 1:
+                if x == 1:
+                    x = 0
+                    y = 0
+                elif x == 2:
+                    x = 2
+                    y = 0
+                else:
+                    y -= 1
+                    x -= 3
+                    direction = UP_LEFT
+            elif x > rows - 1:
+                if y == 1:
+                    x = 0
+                    y = 1
+                else:
+                    x -= 1
+                    y -= 3
+                    direction = UP_LEFT
+
+        elif direction == UP_LEFT:
+            x -= 1
+            y -= 1
+            if y < 0:
+                y += 1
+                x += 3
+                direction = DOWN_RIGHT
+            elif x < 0:
+                x += 1
+                y += 3
+                direction = DOWN_RIGHT
+
+    sweep = _Sweep(path)
+
+    missed = [
+        (x, y) for x in range(rows) for y in range(cols) if (x, y) not in path
+        ]
+
+    if missed or (x, y, direction) not in seen:
+        sweep.extend(missed)
+    else:
+        sweep.loop = seen[(x, y, direction)]
+
+    return sweep
+
 class Alg1:
 
-    def __init__(self, ships):
+    def __init__(self, ships, shape=(10, 10)):
 
         self._ships = ships
+        self._shape = tuple(shape)
+        self._analyzer = BoardAnalyzer(ships, self._shape)
+        self._batch = None
 
     def action(self, time_step):
 
-        if time_step.is_last():
+        if time_step.step_type == LAST:
+            self._analyzer.reset()
             return 0
 
-        state = time_step.observation
+        profiler = profiling.profiler
 
-        mask = np.zeros((10, 10), dtype=bool)
+        analyzer = self._analyzer
+        analyzer.update(time_step.observation)
 
-        sunk_ships = []
-        sunk_tiles = []
+        if profiler is not None:
+            start = time.perf_counter_ns()
+        cell = analyzer.target()
+        if profiler is not None:
+            profiler.record("target", start)
+            start = time.perf_counter_ns()
+        if cell is not None:
+            return cell
 
-        for y in range(10):
-            for x in range(10):
+        mask = analyzer.mask
+        smallest = analyzer.smallest
+        rows, cols = self._shape
 
-                if state[x, y] in (1,2):
-                    mask[x, y] = True
-                elif state[x, y] == 3:
-                    for mask_x in range(x-1, x+2):
-                        for mask_y in range(y-1, y+2):
-                            if 0 <= mask_x <= 9 \
-                                and 0 <= mask_y <= 9:
-                                    mask[mask_x, mask_y] = True
+        # Cells with room for the smallest ship from them onwards, along x
+        # or along y
+        along_x, along_y = free_runs(mask)
+        along_x = along_x >= smallest
 
-        for y in range(10):
-            for x in range(10):
-                if state[x, y] == 3 and (x, y) not in sunk_tiles:
-                    sunk_tiles.append((x,y))
-                    count = 1
+        possible = along_x | (along_y >= smallest)
 
-                    right = x + 1
-                    while right < 10 and state[right, y] == 3:
-                        count += 1
-                        sunk_tiles.append((right,y))
-                        right += 1
+        if not possible.any():
+            # No remaining ship fits anywhere, which a consistent board never
+            # gets to, so shoots the first cell not shot yet instead of
+            # argmax's cell 0
+            y, x = divmod(
+                int(np.argmax((analyzer.state == UNKNOWN).T)), rows)
+            if profiler is not None:
+                profiler.record("fallback", start)
+            return x * cols + y
 
-                    down = y + 1
+        # Plays the first one in column order
+        y, x = divmod(int(np.argmax(possible.T)), rows)
+        direction = 0 if along_x[x, y] else 1
+        x = x + (smallest -1) * (not direction)
+        y = y + (smallest -1) * direction
 
-                    while down < 10 and state[x, down] == 3:
-                        count += 1
-                        sunk_tiles.append((x, down))
-                        down += 1
+        if profiler is not None:
+            profiler.record("hunt", start)
 
-                    sunk_ships.append(count)
+        return x * cols + y
 
-        ships = []
-        for ship in self._ships:
-            if ship in sunk_ships:
-                sunk_ships.remove(ship)
-            else:
-                ships.append(ship)
-
-        smallest = min(ships)
-
-
-        for y in range(10):
-            for x in range(10):
-                if state[x, y] == 2:
-
-                    if(y < 9 and state[x, y + 1] == 2) \
-                        or (y > 0 and state[x, y-1] == 2):
-
-                        if y < 9:
-                            up = y + 1
-                            while up < 9 and state[x, up] == 2:
-                                up += 1
-                            if state[x, up] == 0:
-                                return x * 10 + up
+    def action_batch(self, observations, is_last):
 
-                        if y > 0:
-                            down = y - 1
-                            while down > 0 and state[x, down] == 2:
-                                down -= 1
-                            if state[x, down] == 0:
-                                return x * 10 + down
+        # Plays one move in each of a batch of games, the same moves action
+        # would. Games whose time step is the last one get 0 and start over.
 
-                    if (x < 9 and state[x + 1, y] == 2) \
-                        or (x > 0 and state[x-1, y] == 2):
+        observations = np.asarray(observations)
+        is_last = np.asarray(is_last, dtype=bool)
+        games = len(observations)
 
+        if self._batch is None or self._batch.batch_size != games:
+            self._batch = BatchAnalyzer(games, self._ships, self._shape)
 
-                        if x < 9:
-                            right = x + 1
-                            while right < 9 and state[right, y] == 2:
-                                right += 1
-                            if state[right, y] == 0:
-                                return right * 10 + y
+        analyzer = self._batch
+        playing = ~is_last
 
-                        if x > 0:
-                            left = x - 1
-                            while left > 0 and state[left, y] == 2:
-                                left -= 1
-                            if state[left, y] == 0:
-                                return left * 10 + y
+        analyzer.reset(is_last)
+        analyzer.update(observations, playing)
 
-                    count = 1
-                    up = y + 1
-                    while up < 10 and not mask[x, up]:
-                        up += 1
-                        count += 1
-                    down = y - 1
-                    while down >= 0 and not mask[x, down]:
-                        down -= 1
-                        count += 1
+        actions = analyzer.target(playing)
+        hunting = playing & (actions < 0)
 
-                    if count >= smallest:
+        if hunting.any():
 
-                        if y < 9:
-                            up = y + 1
-                            while up < 9 and state[x, up] == 2:
-                                up += 1
-                            if state[x, up] == 0:
-                                return x * 10 + up
+            rows, cols = self._shape
+            smallest = analyzer.smallest
 
-                        if y > 0:
-                            down = y - 1
-                            while down > 0 and state[x, down] == 2:
-                                down -= 1
-                            if state[x, down] == 0:
-                                return x * 10 + down
+            along_x, along_y = free_runs(analyzer.mask)
+            along_x = along_x >= smallest[:, None, None]
+            possible = along_x | (along_y >= smallest[:, None, None])
 
-                    if x < 9:
-                        right = x + 1
-                        while right < 9 and state[right, y] == 2:
-                            right += 1
-                        if state[right, y] == 0:
-                            return right * 10 + y
+            y, x = np.divmod(
+                np.argmax(possible.swapaxes(1, 2).reshape(games, -1), axis=1),
+                rows)
+            direction = ~along_x[np.arange(games), x, y]
+            x = x + (smallest - 1) * ~direction
+            y = y + (smallest - 1) * direction
 
-                    if x > 0:
-                        left = x - 1
-                        while left > 0 and state[left, y] == 2:
-                            left -= 1
-                        if state[left, y] == 0:
-                            return left * 10 + y
+            # Same fallback as action where nothing fits
+            stuck = ~possible.reshape(games, -1).any(axis=1)
+            if stuck.any():
+                y[stuck], x[stuck] = np.divmod(
+                    np.argmax(
+                        (analyzer.state[stuck] == UNKNOWN).swapaxes(1, 2)
+                        .reshape(stuck.sum(), -1),
+                        axis=1),
+                    rows)
 
+            actions = np.where(hunting, x * cols + y, actions)
 
+        actions[is_last] = 0
+        return actions
 
-        possible_moves = {}
+class Bouncy:
 
-        for y in range(10):
-            for x in range(10):
-                if not mask[x, y]:
-                    count = 1
+    #TODO: optimize to account for smallest ship size
 
-                    right = x + 1
-                    while right < 10 and not mask[right, y]:
-                        count += 1
-                        right += 1
+    def __init__(self, ships, shape=(10, 10)):
 
-                    if count >= smallest:
-                        possible_moves[(x,y, 0)] = count
+        self._ships = ships
+        self._shape = tuple(shape)
+        self._analyzer = BoardAnalyzer(ships, self._shape)
+        self._sweep = diagonal_sweep(self._shape)
+        self._sweep_cells = np.array(
+            [x * self._shape[1] + y for x, y in self._sweep])
+        self._position = 0
+        # Analyzer and cursor of every game of action_batch
+        self._batch = None
+        self._positions = None
 
-                    count = 1
+    def action(self, time_step):
 
-                    down = y + 1
-                    while down < 10 and not mask[x, down]:
-                        count += 1
-                        down += 1
-
-                    if count >= smallest:
-                        possible_moves[(x,y, 1)] = count
+        if time_step.step_type == LAST:
+            self._analyzer.reset()
+            self._position = 0
+            return 0
 
+        profiler = profiling.profiler
 
-        #TODO FIX THIS OPTIMIZATION
-        # for move, count in possible_moves.items():
-        #     for offset in range(1, count):
+        analyzer = self._analyzer
+        analyzer.update(time_step.observation)
 
-        #         for other_move, other_count in possible_moves.items():
+        if profiler is not None:
+            start = time.perf_counter_ns()
+        cell = analyzer.target()
+        if profiler is not None:
+            profiler.record("target", start)
+            start = time.perf_counter_ns()
+        if cell is not None:
+            return cell
 
-        #             for other_offset in range(1, other_count):
+        mask = analyzer.mask
 
-        #                 if (move[0] + offset * (not move[2]),
-        #                     move[1] + offset * move[2]) == \
-        #                     (other_move[0] + other_offset * (not other_move[2]),
-        #                      other_move[1] + other_offset * other_move[2]):
+        # Moves the cursor on to the first unmasked cell of the path,
+        # looping back if it runs off the end
+        free = ~mask.ravel()[self._sweep_cells]
 
-        #                         return (move[0] + offset * (not move[2])) * 10 \
-        #                             + (move[1] + offset * move[2])
+        ahead = np.flatnonzero(free[self._position:])
+        if len(ahead):
+            self._position += int(ahead[0])
+            if profiler is not None:
+                profiler.record("hunt", start)
+        else:
+            loop = self._sweep.loop
+            self._position = loop + int(np.flatnonzero(free[loop:])[0])
+            if profiler is not None:
+                profiler.record("fallback", start)
 
-        move = list(possible_moves.keys())[0]
-        x = move[0] + (smallest -1) * (not move[2])
-        y = move[1] + (smallest -1) * (move[2])
+        return int(self._sweep_cells[self._position])
 
-        return x * 10 + y
+    def action_batch(self, observations, is_last):
 
-class Bouncy:
+        # Plays one move in each of a batch of games, the same moves action
+        # would. Games whose time step is the last one get 0 and start over.
 
-    #TODO: optimize to account for smallest ship size
+        observations = np.asarray(observations)
+        is_last = np.asarray(is_last, dtype=bool)
+        games = len(observations)
+
+        if self._batch is None or self._batch.batch_size != games:
+            self._batch = BatchAnalyzer(games, self._ships, self._shape)
+            self._positions = np.zeros(games, dtype=np.intp)
+
+        analyzer = self._batch
+        playing = ~is_last
 
-    def __init__(self, ships):
+        analyzer.reset(is_last)
+        analyzer.update(observations, playing)
+
+        actions = analyzer.target(playing)
+        hunting = playing & (actions < 0)
+
+        if hunting.any():
+
+            free = ~analyzer.mask.reshape(games, -1)[:, self._sweep_cells]
+            index = np.arange(len(self._sweep))
+
+            ahead = free & (index >= self._positions[:, None])
+            looped = free & (index >= self._sweep.loop)
+            positions = np.where(
+                ahead.any(axis=1), ahead.argmax(axis=1), looped.argmax(axis=1))
+
+            self._positions = np.where(hunting, positions, self._positions)
+            actions = np.where(hunting, self._sweep_cells[positions], actions)
+
+        self._positions[is_last] = 0
+        actions[is_last] = 0
+        return actions
+
+class Density:
+
+    # Fires at the cell covered by the most placements of the remaining
+    # ships that still fit the board: clear of misses and of the cells
+    # around sunk ships, and either covering open hits or not touching
+    # them. All placements are checked at once with matrix products
+    # against the placement table.
+
+    def __init__(self, ships, shape=(10, 10)):
 
         self._ships = ships
-        self._x = 1
-        self._y = 0
-        self._direction = DOWN_RIGHT
+        self._shape = tuple(shape)
+        self._analyzer = BoardAnalyzer(ships, self._shape)
+
+        placements = placement_table(self._shape, ships)
+        self._cells = placements.cell_matrix
+        self._halos = placements.halo_matrix
+        self._lengths = np.array(placements.lengths)
+
+        self._batch = None
+
+    def _density(self, mask, hits, afloat):
+
+        # Weighted number of fitting placements covering each cell, for
+        # (games, cells) masks and hits and (games, placements) numbers of
+        # ships afloat of each placement's length
+
+        hits = hits.astype(np.float32)
+        blocked = (mask & ~(hits > 0)).astype(np.float32)
+
+        blocked_cells = blocked @ self._cells.T
+        hit_cells = hits @ self._cells.T
+        touched = hits @ self._halos.T
+
+        # Placements of ships still afloat count once per such ship
+        weights = (
+            afloat * (blocked_cells == 0) * (touched == hit_cells)
+            * HIT_WEIGHT ** hit_cells)
+
+        return weights @ self._cells
+
+    def density(self, analyzer=None):
+
+        if analyzer is None:
+            analyzer = self._analyzer
+
+        afloat = np.bincount(
+            analyzer.remaining, minlength=self._lengths.max() + 1
+            )[self._lengths]
+
+        return self._density(
+            analyzer.mask.reshape(1, -1), analyzer.hits.reshape(1, -1),
+            afloat[None])[0]
 
     def action(self, time_step):
 
-        if time_step.is_last():
-            self.__init__(self._ships)
+        if time_step.step_type == LAST:
+            self._analyzer.reset()
             return 0
 
-        state = time_step.observation
+        self._analyzer.update(time_step.observation)
+
+        density = self.density()
+        density[self._analyzer.mask.reshape(-1)] = -1
+
+        return int(np.argmax(density))
+
+    def action_batch(self, observations, is_last):
+
+        # Plays one move in each of a batch of games, the same moves action
+        # would. Games whose time step is the last one get 0 and start over.
+
+        observations = np.asarray(observations)
+        is_last = np.asarray(is_last, dtype=bool)
+        games = len(observations)
+
+        if self._batch is None or self._batch.batch_size != games:
+            self._batch = BatchAnalyzer(games, self._ships, self._shape)
+
+        analyzer = self._batch
+
+        analyzer.reset(is_last)
+        analyzer.update(observations, ~is_last)
+
+        mask = analyzer.mask.reshape(games, -1)
+        density = self._density(
+            mask, analyzer.hits.reshape(games, -1),
+            analyzer.remaining[:, self._lengths])
+        density[mask] = -1
+
+        actions = np.argmax(density, axis=1)
+        actions[is_last] = 0
+        return actions
+
+def _sample_placements(args):
+
+    # Draws layouts until samples were accepted or seconds have passed,
+    # whichever comes first, and returns how often each placement was part
+    # of an accepted layout along with the number of accepted layouts
+
+    shape, fleet, remaining, blocked, hits, samples, seconds, seed = args
+
+    placements = placement_table(shape, fleet)
+    random_state = np.random.RandomState(seed)
+
+    counts = np.zeros(len(placements), dtype=np.int64)
+    accepted = 0
+    draws = 0
 
-        mask = np.zeros((10, 10), dtype=bool)
+    if seconds is not None:
+        deadline = time.perf_counter() + seconds
 
-        sunk_ships = []
-        sunk_tiles = []
+    while True:
 
-        for y in range(10):
-            for x in range(10):
+        if samples is not None and (
+                accepted == samples or draws == samples * MAX_DRAWS_PER_SAMPLE):
+            break
+        if seconds is not None and time.perf_counter() > deadline:
+            break
 
-                if state[x, y] in (1,2):
-                    mask[x, y] = True
-                elif state[x, y] == 3:
-                    for mask_x in range(x-1, x+2):
-                        for mask_y in range(y-1, y+2):
-                            if 0 <= mask_x <= 9 \
-                                and 0 <= mask_y <= 9:
-                                    mask[mask_x, mask_y] = True
+        draws += 1
+        layout = placements.sample_consistent(
+            remaining, blocked, hits, random_state)
 
-        for y in range(10):
-            for x in range(10):
-                if state[x, y] == 3 and (x, y) not in sunk_tiles:
-                    sunk_tiles.append((x,y))
-                    count = 1
+        if layout is not None:
+            counts[layout] += 1
+            accepted += 1
 
-                    right = x + 1
-                    while right < 10 and state[right, y] == 3:
-                        count += 1
-                        sunk_tiles.append((right,y))
-                        right += 1
+    return counts, accepted
 
-                    down = y + 1
+class MonteCarlo(Density):
 
-                    while down < 10 and state[x, down] == 3:
-                        count += 1
-                        sunk_tiles.append((x, down))
-                        down += 1
+    # Draws layouts of the remaining ships that are consistent with the
+    # board (same no-touch placement rules as the envs) and fires at the
+    # cell they put a ship on most often. Each move stops drawing after
+    # samples layouts or seconds of wall-clock time, whichever comes
+    # first, and plays the best cell so far. With processes, a pool of
+    # that many workers draws in parallel, each with the full time budget
+    # and its share of the samples. Falls back to Density's scores if no
+    # layout was found in time.
 
-                    sunk_ships.append(count)
+    def __init__(
+            self, ships, shape=(10, 10),
+            samples=None, seconds=None,
+            processes=None, seed=None):
 
-        ships = []
-        for ship in self._ships:
-            if ship in sunk_ships:
-                sunk_ships.remove(ship)
+        super().__init__(ships, shape)
+
+        if samples is None and seconds is None:
+            samples = MONTE_CARLO_SAMPLES
+
+        self._samples = samples
+        self._seconds = seconds
+        self._processes = processes
+        self._random_state = np.random.RandomState(seed)
+
+        self._pool = multiprocessing.Pool(processes) if processes else None
+
+        # Analyzer of every game of action_batch
+        self._analyzers = []
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def action_batch(self, observations, is_last):
+
+        # Same moves as action, one game after another, since every move
+        # already spends its whole budget on drawing layouts
+
+        if len(self._analyzers) != len(observations):
+            self._analyzers = [
+                BoardAnalyzer(self._ships, self._shape)
+                for _ in observations]
+
+        actions = np.zeros(len(observations), dtype=np.int64)
+
+        for game, (analyzer, observation, last) in enumerate(
+                zip(self._analyzers, observations, is_last)):
+            if last:
+                analyzer.reset()
             else:
-                ships.append(ship)
-
-        smallest = min(ships)
-
-
-        for y in range(10):
-            for x in range(10):
-                if state[x, y] == 2:
-
-                    if(y < 9 and state[x, y + 1] == 2) \
-                        or (y > 0 and state[x, y-1] == 2):
-
-                        if y < 9:
-                            up = y + 1
-                            while up < 9 and state[x, up] == 2:
-                                up += 1
-                            if state[x, up] == 0:
-                                return x * 10 + up
-
-                        if y > 0:
-                            down = y - 1
-                            while down > 0 and state[x, down] == 2:
-                                down -= 1
-                            if state[x, down] == 0:
-                                return x * 10 + down
-
-                    if (x < 9 and state[x + 1, y] == 2) \
-                        or (x > 0 and state[x-1, y] == 2):
-
-
-                        if x < 9:
-                            right = x + 1
-                            while right < 9 and state[right, y] == 2:
-                                right += 1
-                            if state[right, y] == 0:
-                                return right * 10 + y
-
-                        if x > 0:
-                            left = x - 1
-                            while left > 0 and state[left, y] == 2:
-                                left -= 1
-                            if state[left, y] == 0:
-                                return left * 10 + y
-
-                    count = 1
-                    up = y + 1
-                    while up < 10 and not mask[x, up]:
-                        up += 1
-                        count += 1
-                    down = y - 1
-                    while down >= 0 and not mask[x, down]:
-                        down -= 1
-                        count += 1
-
-                    if count >= smallest:
-
-                        if y < 9:
-                            up = y + 1
-                            while up < 9 and state[x, up] == 2:
-                                up += 1
-                            if state[x, up] == 0:
-                                return x * 10 + up
-
-                        if y > 0:
-                            down = y - 1
-                            while down > 0 and state[x, down] == 2:
-                                down -= 1
-                            if state[x, down] == 0:
-                                return x * 10 + down
-
-                    if x < 9:
-                        right = x + 1
-                        while right < 9 and state[right, y] == 2:
-                            right += 1
-                        if state[right, y] == 0:
-                            return right * 10 + y
-
-                    if x > 0:
-                        left = x - 1
-                        while left > 0 and state[left, y] == 2:
-                            left -= 1
-                        if state[left, y] == 0:
-                            return left * 10 + y
-
-        while mask[self._x, self._y]:
-
-            if self._direction == DOWN_RIGHT:
-                self._x += 1
-                self._y += 1
-                if self._y > 9:
-                    if self._x == 1:
-                        self._x = 0
-                        self._y = 0
-                    elif self._x == 2:
-                        self._x = 2
-                        self._y = 0
-                    else:
-                        self._y -= 1
-                        self._x -= 3
-                        self._direction = UP_LEFT
-                elif self._x > 9:
-                    if self._y == 1:
-                        self._x = 0
-                        self._y = 1
-                    else:
-                        self._x -= 1
-                        self._y -= 3
-                        self._direction = UP_LEFT
-
-            elif self._direction == UP_LEFT:
-                self._x -= 1
-                self._y -= 1
-                if self._y < 0:
-                    self._y += 1
-                    self._x += 3
-                    self._direction = DOWN_RIGHT
-                elif self._x < 0:
-                    self._x += 1
-                    self._y += 3
-                    self._direction = DOWN_RIGHT
-
-
-        return self._x * 10 + self._y
+                analyzer.update(observation)
+                actions[game] = self._move(analyzer)
+
+        return actions
+
+    def action(self, time_step):
+
+        if time_step.step_type == LAST:
+            self._analyzer.reset()
+            return 0
+
+        self._analyzer.update(time_step.observation)
+
+        return self._move(self._analyzer)
+
+    def _move(self, analyzer):
+
+        args = (
+            self._shape,
+            tuple(self._ships),
+            tuple(analyzer.remaining),
+            to_bits(analyzer.mask & ~analyzer.hits),
+            to_bits(analyzer.hits)
+            )
+
+        if self._pool is None:
+            results = [_sample_placements(args + (
+                self._samples, self._seconds,
+                self._random_state.randint(2**31)))]
+        else:
+            samples = self._samples
+            if samples is not None:
+                samples = -(-samples // self._processes)
+            results = self._pool.map(_sample_placements, [
+                args + (samples, self._seconds,
+                        self._random_state.randint(2**31))
+                for _ in range(self._processes)
+                ])
+
+        counts = sum(counts for counts, _ in results)
+
+        if any(accepted for _, accepted in results):
+            scores = counts @ self._cells
+        else:
+            scores = self.density(analyzer)
+
+        scores[analyzer.mask.reshape(-1)] = -1
+
+        return int(np.argmax(scores))
+
+class Endgame:
+
+    # Plays the moves of another algorithm until few enough fleet layouts
+    # are left for an EndgameSolver, then the solver's. The wrapped
+    # algorithm gets every last time step, so it can start over.
+
+    def __init__(self, algorithm, ships, shape=(10, 10), solver=None):
+
+        self._algorithm = algorithm(ships, shape)
+        self._analyzer = BoardAnalyzer(ships, shape)
+
+        if solver is None:
+            solver = EndgameSolver(ships, shape)
+        self.solver = solver
+
+    def action(self, time_step):
+
+        if time_step.step_type == LAST:
+            self._analyzer.reset()
+            return self._algorithm.action(time_step)
+
+        analyzer = self._analyzer
+        analyzer.update(time_step.observation)
+
+        solved = self.solver.solve(
+            to_bits(analyzer.state == MISS),
+            to_bits(analyzer.hits),
+            to_bits(analyzer.state == SUNK),
+            analyzer.remaining,
+            to_bits(analyzer.mask & ~analyzer.hits)
+            )
+
+        if solved is not None:
+            return solved[1]
+
+        return self._algorithm.action(time_step)
+
+class Cached:
+
+    # Remembers the moves of an algorithm whose move only depends on the
+    # position, like Alg1 or Density (not Bouncy, whose sweep cursor moves
+    # on between games), keyed with cache.board_key. Moves are looked up in
+    # an opening book first (see openingbook.py), then in an LRU cache of
+    # maxsize moves, and the algorithm is only asked on a miss. Its
+    # analyzer diffs against the last board it saw, so skipping it on hits
+    # is fine.
+
+    def __init__(
+            self, algorithm, ships, shape=(10, 10),
+            maxsize=CACHE_SIZE, book=None):
+
+        self._algorithm = algorithm(ships, shape)
+
+        self.cache = LRUCache(maxsize)
+        self.book = {} if book is None else book
+        self.book_hits = 0
+
+    def action(self, time_step):
+
+        if time_step.step_type == LAST:
+            return self._algorithm.action(time_step)
+
+        key = board_key(time_step.observation)
+
+        action = self.book.get(key)
+        if action is not None:
+            self.book_hits += 1
+            return action
+
+        action = self.cache.get(key)
+        if action is None:
+            action = int(self._algorithm.action(time_step))
+            self.cache.put(key, action)
+
+        return action
+
+# Algorithms tournament.py plays, by name, each called with (ships, shape)
+ALGORITHMS = {
+    "Alg1": Alg1,
+    "Bouncy": Bouncy,
+    "Density": Density,
+    "MonteCarlo": functools.partial(MonteCarlo, samples=100, seed=0),
+    "Alg1+Endgame": functools.partial(Endgame, Alg1),
+    "Density+Endgame": functools.partial(Endgame, Density),
+    "Alg1+Cache": functools.partial(Cached, Alg1),
+    "Density+Cache": functools.partial(Cached, Density),
+    }
 
 if __name__ == "__main__":
-    from env import PyBattleshipEnv
+    from game import BattleshipGame
 
-    game = PyBattleshipEnv()
+    game = BattleshipGame()
 
     ts = game.reset()
 
-    bot = Bouncy([5,4,3,3,2])
+    bot = Bouncy([5,4,3,3,2], game.board.shape)
 
     # Bouncy averages 43.9
     # Alg1 averages  41.8
+    # Density averages 38.3
 
     scores = []
     while len(scores) < 20000:
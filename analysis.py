@@ -0,0 +1,338 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+
+import numpy as np
+
+import profiling
+from board import UNKNOWN, HIT, SUNK
+
+# Whole-board helpers on boolean (..., rows, cols) arrays, one board or a
+# batch of them. They are built from shifted slices and cumulative sums,
+# so they cost a few NumPy calls instead of a Python loop per cell.
+
+def dilate(cells):
+    # Adds the 8 neighbours of every set cell
+    grown = cells.copy()
+    grown[..., 1:, :] |= cells[..., :-1, :]
+    grown[..., :-1, :] |= cells[..., 1:, :]
+    wide = grown.copy()
+    wide[..., 1:] |= grown[..., :-1]
+    wide[..., :-1] |= grown[..., 1:]
+    return wide
+
+def label_segments(cells):
+
+    # Labels the 4-connected groups of set cells (ship segments, since
+    # ships are straight and don't touch) with 1, 2, ..., board by board
+    # and in column order within a board. Labels spread along the groups
+    # until they settle, which takes as many rounds as the longest segment.
+
+    rows, cols = cells.shape[-2:]
+    unset = cells.size + 1
+    order = np.arange(1, cells.size + 1).reshape(
+        cells.shape[:-2] + (cols, rows)).swapaxes(-1, -2)
+    labels = np.where(cells, order, unset)
+
+    while True:
+        spread = labels.copy()
+        np.minimum(spread[..., 1:, :], labels[..., :-1, :], out=spread[..., 1:, :])
+        np.minimum(spread[..., :-1, :], labels[..., 1:, :], out=spread[..., :-1, :])
+        np.minimum(spread[..., 1:], labels[..., :-1], out=spread[..., 1:])
+        np.minimum(spread[..., :-1], labels[..., 1:], out=spread[..., :-1])
+        spread[~cells] = unset
+        if (spread == labels).all():
+            break
+        labels = spread
+
+    # Every group now holds the index of its first cell
+    labelled = np.zeros(cells.shape, dtype=np.intp)
+    labelled[cells] = np.unique(labels[cells], return_inverse=True)[1] + 1
+    return labelled
+
+def segment_lengths(cells):
+    # Number of cells in each labelled segment, in label order
+    return np.bincount(label_segments(cells)[cells])[1:]
+
+def free_runs(mask):
+
+    # Number of unmasked cells from each cell onwards, along x (rows) and
+    # along y (columns), 0 for masked cells
+
+    free = ~mask
+
+    # Counts free cells back from the far edge, minus the count at the
+    # last masked cell passed
+    along_x = free[..., ::-1, :].cumsum(-2)
+    along_x -= np.maximum.accumulate(along_x * mask[..., ::-1, :], -2)
+    along_y = free[..., ::-1].cumsum(-1)
+    along_y -= np.maximum.accumulate(along_y * mask[..., ::-1], -1)
+
+    return along_x[..., ::-1, :], along_y[..., ::-1]
+
+def to_bits(cells):
+    # Integer bitboard (bit row * cols + col) of a boolean array, as used by
+    # board.Board and placement.PlacementTable
+    return int.from_bytes(
+        np.packbits(cells.reshape(-1), bitorder="little").tobytes(), "little")
+
+def target_from(state, mask, smallest, x, y):
+
+    # Alg1 and Bouncy's rules for the cell to shoot next to the hit at
+    # (x, y), or None
+
+    rows, cols = state.shape
+
+    if(y < cols - 1 and state[x, y + 1] == 2) \
+        or (y > 0 and state[x, y-1] == 2):
+
+        if y < cols - 1:
+            up = y + 1
+            while up < cols - 1 and state[x, up] == 2:
+                up += 1
+            if state[x, up] == 0:
+                return x * cols + up
+
+        if y > 0:
+            down = y - 1
+            while down > 0 and state[x, down] == 2:
+                down -= 1
+            if state[x, down] == 0:
+                return x * cols + down
+
+    if (x < rows - 1 and state[x + 1, y] == 2) \
+        or (x > 0 and state[x-1, y] == 2):
+
+
+        if x < rows - 1:
+            right = x + 1
+            while right < rows - 1 and state[right, y] == 2:
+                right += 1
+            if state[right, y] == 0:
+                return right * cols + y
+
+        if x > 0:
+            left = x - 1
+            while left > 0 and state[left, y] == 2:
+                left -= 1
+            if state[left, y] == 0:
+                return left * cols + y
+
+    count = 1
+    up = y + 1
+    while up < cols and not mask[x, up]:
+        up += 1
+        count += 1
+    down = y - 1
+    while down >= 0 and not mask[x, down]:
+        down -= 1
+        count += 1
+
+    if count >= smallest:
+
+        if y < cols - 1:
+            up = y + 1
+            while up < cols - 1 and state[x, up] == 2:
+                up += 1
+            if state[x, up] == 0:
+                return x * cols + up
+
+        if y > 0:
+            down = y - 1
+            while down > 0 and state[x, down] == 2:
+                down -= 1
+            if state[x, down] == 0:
+                return x * cols + down
+
+    if x < rows - 1:
+        right = x + 1
+        while right < rows - 1 and state[right, y] == 2:
+            right += 1
+        if state[right, y] == 0:
+            return right * cols + y
+
+    if x > 0:
+        left = x - 1
+        while left > 0 and state[left, y] == 2:
+            left -= 1
+        if state[left, y] == 0:
+            return left * cols + y
+
+    return None
+
+class BoardAnalyzer:
+
+    # What Alg1 and Bouncy know about a game, kept up to date from one
+    # observation to the next. update() only looks at the cells that changed
+    # since the last observation (usually the one just shot), so a move
+    # costs a few array operations instead of rescanning the board:
+    #   mask       cells that can't hold an unfound ship: misses, hits and
+    #              everything next to a sunk ship
+    #   remaining  lengths of the ships not sunk yet
+    #   hits       cells of ships hit but not sunk yet
+    # An observation with fewer shots than the last one starts a new game.
+
+    def __init__(self, ships, shape=(10, 10)):
+
+        self.ships = tuple(int(ship) for ship in ships)
+        self.shape = tuple(shape)
+
+        self.state = np.zeros(self.shape, dtype=np.int32)
+        self.mask = np.zeros(self.shape, dtype=bool)
+        self.hits = np.zeros(self.shape, dtype=bool)
+
+        # Flat views, indexed by cell
+        self._state = self.state.reshape(-1)
+        self._mask = self.mask.reshape(-1)
+        self._hits = self.hits.reshape(-1)
+
+        self.reset()
+
+    def reset(self):
+        self.state.fill(UNKNOWN)
+        self.mask.fill(False)
+        self.hits.fill(False)
+        self.remaining = list(self.ships)
+
+    @property
+    def smallest(self):
+        return min(self.remaining)
+
+    def update(self, observation):
+
+        profiler = profiling.profiler
+        if profiler is not None:
+            start = time.perf_counter_ns()
+
+        observation = observation.reshape(-1)
+
+        changed = np.flatnonzero(observation != self._state)
+        if not len(changed):
+            if profiler is not None:
+                profiler.record("mask", start)
+            return
+
+        values = observation[changed]
+
+        if (values < self._state[changed]).any():
+            self.reset()
+            changed = np.flatnonzero(observation)
+            values = observation[changed]
+
+        self._state[changed] = values
+        self._mask[changed] = True
+        self._hits[changed] = values == HIT
+
+        sunk = changed[values == SUNK]
+
+        if profiler is not None:
+            profiler.record("mask", start)
+
+        if len(sunk):
+            if profiler is not None:
+                start = time.perf_counter_ns()
+            cells = np.zeros(self.shape, dtype=bool)
+            cells.flat[sunk] = True
+            self.mask |= dilate(cells)
+            # Ships can't touch, so the newly sunk cells are whole ships
+            for length in segment_lengths(cells).tolist():
+                if length in self.remaining:
+                    self.remaining.remove(length)
+            if profiler is not None:
+                profiler.record("sunk", start)
+
+    def target(self):
+
+        # Cell next to an open hit to shoot at, or None when hunting. Hits
+        # are tried in column order.
+
+        if not self._hits.any():
+            return None
+
+        smallest = self.smallest
+        for y, x in np.argwhere(self.hits.T).tolist():
+            cell = target_from(self.state, self.mask, smallest, x, y)
+            if cell is not None:
+                return cell
+
+        return None
+
+class BatchAnalyzer:
+
+    # BoardAnalyzer for a batch of games, with one row per game in every
+    # array so that all games are updated together:
+    #   state, mask, hits  (games, rows, cols)
+    #   remaining          (games, longest ship + 1), how many ships of
+    #                      each length are still afloat
+    # Methods take a boolean mask of the games to work on.
+
+    def __init__(self, batch_size, ships, shape=(10, 10)):
+
+        self.batch_size = batch_size
+        self.ships = tuple(int(ship) for ship in ships)
+        self.shape = tuple(shape)
+
+        self.state = np.zeros((batch_size,) + self.shape, dtype=np.int32)
+        self.mask = np.zeros((batch_size,) + self.shape, dtype=bool)
+        self.hits = np.zeros((batch_size,) + self.shape, dtype=bool)
+
+        self._fleet = np.bincount(self.ships)
+        self.remaining = np.zeros((batch_size, len(self._fleet)), dtype=np.int64)
+
+        self.reset(np.ones(batch_size, dtype=bool))
+
+    def reset(self, games):
+        self.state[games] = UNKNOWN
+        self.mask[games] = False
+        self.hits[games] = False
+        self.remaining[games] = self._fleet
+
+    @property
+    def smallest(self):
+        # 0 for games with no ships left
+        return np.argmax(self.remaining > 0, axis=1)
+
+    def update(self, observations, games):
+
+        self.reset(games & (observations < self.state).any(axis=(1, 2)))
+
+        changed = (observations != self.state) & games[:, None, None]
+        if not changed.any():
+            return
+
+        np.copyto(self.state, observations, where=changed)
+        self.mask |= changed
+        np.equal(self.state, HIT, out=self.hits)
+
+        sunk = changed & (observations == SUNK)
+
+        if sunk.any():
+            self.mask |= dilate(sunk)
+
+            labels = label_segments(sunk)[sunk]
+            lengths = np.bincount(labels)[1:]
+            boards = np.zeros(len(lengths), dtype=np.intp)
+            boards[labels - 1] = np.nonzero(sunk)[0]
+
+            # Lengths that aren't afloat are ignored, like BoardAnalyzer does
+            known = lengths < self.remaining.shape[1]
+            np.subtract.at(self.remaining, (boards[known], lengths[known]), 1)
+            np.maximum(self.remaining, 0, out=self.remaining)
+
+    def target(self, games):
+
+        # BoardAnalyzer.target for every game, -1 for games that hunt
+
+        cells = np.full(self.batch_size, -1)
+        smallest = self.smallest
+
+        for game in np.flatnonzero(games & self.hits.any(axis=(1, 2))):
+            for y, x in np.argwhere(self.hits[game].T).tolist():
+                cell = target_from(
+                    self.state[game], self.mask[game], smallest[game], x, y)
+                if cell is not None:
+                    cells[game] = cell
+                    break
+
+        return cells
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+from placement import placement_table
+
+# Cell values of observations, also returned by Board.shoot
+UNKNOWN = 0
+MISS = 1
+HIT = 2
+SUNK = 3
+
+class Board:
+
+    # Game rules for one board of any size and fleet. Misses, hits, sunk
+    # cells and ship occupancy are integer bitboards (bit row * cols + col),
+    # so membership, neighbourhood and "all sunk" checks are single bitwise
+    # operations. observation mirrors them as the (rows, cols) array the
+    # envs return.
+
+    def __init__(self, shape=(10, 10), ships=(5, 4, 3, 3, 2), placements=None):
+
+        self.shape = tuple(shape)
+        self.ships = tuple(int(ship) for ship in ships)
+
+        rows, cols = self.shape
+        self.size = rows * cols
+
+        if placements is None:
+            placements = placement_table(self.shape, self.ships)
+        self.placements = placements
+
+        self.full = (1 << self.size) - 1
+
+        first_col = sum(1 << (row * cols) for row in range(rows))
+        self._not_first_col = self.full & ~first_col
+        self._not_last_col = self.full & ~(first_col << (cols - 1))
+
+        self.observation = np.zeros(self.shape, dtype=np.int32)
+        self._cells = self.observation.reshape(self.size)
+
+        # 0 for water, i + 1 for the i-th ship of the fleet
+        self._ship_at = bytearray(self.size)
+        self.layout = [None] * len(self.ships)
+        self.ship_masks = [0] * len(self.ships)
+        self.hits_left = list(self.ships)
+        self.ships_left = len(self.ships)
+
+        self.misses = 0
+        self.hits = 0
+        self.sunk = 0
+        self.occupied = 0
+
+    @property
+    def taken(self):
+        return self.misses | self.hits | self.sunk
+
+    @property
+    def all_sunk(self):
+        return self.sunk == self.occupied
+
+    def bit(self, row, col):
+        return 1 << (row * self.shape[1] + col)
+
+    def dilate(self, bits):
+        # Adds the 8 neighbours of every set cell
+        cols = self.shape[1]
+        bits |= (bits << 1) & self._not_first_col | (bits >> 1) & self._not_last_col
+        return (bits | bits << cols | bits >> cols) & self.full
+
+    def reset(self, layout=None):
+
+        # Starts a new game, with a sampled fleet unless a layout (one
+        # placement index per ship) is given
+
+        if layout is None:
+            layout = self.placements.sample(self.ships)
+
+        self.observation.fill(UNKNOWN)
+        self._ship_at[:] = bytes(self.size)
+
+        self.misses = 0
+        self.hits = 0
+        self.sunk = 0
+        self.occupied = 0
+        self.ships_left = len(self.ships)
+
+        for ship, pid in enumerate(layout):
+            self.layout[ship] = pid
+            self.ship_masks[ship] = self.placements.masks[pid]
+            self.hits_left[ship] = self.ships[ship]
+            self.occupied |= self.placements.masks[pid]
+            for cell in self.placements.cells[pid]:
+                self._ship_at[cell] = ship + 1
+
+    def shoot(self, cell):
+
+        # Resolves a shot at a flat cell index and returns the cell's new
+        # value, or UNKNOWN if it had already been shot
+
+        bit = 1 << cell
+
+        if (self.misses | self.hits | self.sunk) & bit:
+            return UNKNOWN
+
+        ship = self._ship_at[cell]
+
+        if not ship:
+            self.misses |= bit
+            self._cells[cell] = MISS
+            return MISS
+
+        ship -= 1
+        self.hits_left[ship] -= 1
+
+        if self.hits_left[ship]:
+            self.hits |= bit
+            self._cells[cell] = HIT
+            return HIT
+
+        self.hits &= ~self.ship_masks[ship]
+        self.sunk |= self.ship_masks[ship]
+        self._cells[self.placements.cells[self.layout[ship]]] = SUNK
+        self.ships_left -= 1
+        return SUNK
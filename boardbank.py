@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import multiprocessing
+import os
+
+import numpy as np
+
+from placement import placement_table
+
+CHUNK_SIZE = 10_000
+
+def bank_path(directory, shape=(10, 10), ships=(5, 4, 3, 3, 2)):
+    # Banks are keyed by board size and fleet (in fleet order, since layouts
+    # hold one placement per ship)
+    return os.path.join(
+        directory,
+        f"boards {shape[0]}x{shape[1]} "
+        f"{'-'.join(str(ship) for ship in ships)}.npy"
+        )
+
+def _generate_chunk(args):
+
+    shape, ships, seed, chunk, count = args
+
+    placements = placement_table(shape, ships)
+    # Every chunk has its own seed, so the bank doesn't depend on how the
+    # chunks were spread over processes
+    random_state = np.random.RandomState([seed, chunk])
+
+    return np.array(
+        [placements.sample(ships, random_state) for _ in range(count)],
+        dtype=np.int16
+        )
+
+def generate_bank(
+        directory, count,
+        shape=(10, 10), ships=(5, 4, 3, 3, 2),
+        seed=0, processes=None):
+
+    # Writes count layouts to an .npy file, one row of placement indices
+    # (see placement.PlacementTable) per board, and returns its path
+
+    shape = tuple(shape)
+    ships = tuple(int(ship) for ship in ships)
+
+    path = bank_path(directory, shape, ships)
+    os.makedirs(directory, exist_ok=True)
+
+    layouts = np.lib.format.open_memmap(
+        path, mode="w+", dtype=np.int16, shape=(count, len(ships)))
+
+    chunks = [
+        (shape, ships, seed, chunk, min(CHUNK_SIZE, count - start))
+        for chunk, start in enumerate(range(0, count, CHUNK_SIZE))
+        ]
+
+    with multiprocessing.Pool(processes) as pool:
+        start = 0
+        for chunk in pool.imap(_generate_chunk, chunks):
+            layouts[start:start + len(chunk)] = chunk
+            start += len(chunk)
+
+    layouts.flush()
+    del layouts
+
+    return path
+
+class BoardBank:
+
+    # Memory-mapped view of a generated bank. Workers given the same bank
+    # and different shard numbers get disjoint, contiguous ranges of
+    # boards, and cycle through their own range.
+
+    def __init__(
+            self, directory,
+            shape=(10, 10), ships=(5, 4, 3, 3, 2),
+            shard=0, num_shards=1):
+
+        if not 0 <= shard < num_shards:
+            raise ValueError(f"Shard {shard} out of range for {num_shards} shards")
+
+        self.shape = tuple(shape)
+        self.ships = tuple(int(ship) for ship in ships)
+        self.placements = placement_table(self.shape, self.ships)
+
+        self._layouts = np.load(
+            bank_path(directory, self.shape, self.ships), mmap_mode="r")
+
+        if self._layouts.ndim != 2 or self._layouts.shape[1] != len(self.ships):
+            raise ValueError(
+                f"Bank holds layouts of shape {self._layouts.shape[1:]}, "
+                f"expected ({len(self.ships)},)")
+
+        self._start = len(self._layouts) * shard // num_shards
+        self._stop = len(self._layouts) * (shard + 1) // num_shards
+
+        if self._start == self._stop:
+            raise ValueError(f"Shard {shard} of {num_shards} holds no boards")
+
+        self._index = self._start
+
+    def __len__(self):
+        return self._stop - self._start
+
+    @property
+    def index(self):
+        # Index of the board next() will return
+        return self._index
+
+    def seek(self, index):
+        # Makes next() continue from the given (bank-wide) board index
+        if not self._start <= index < self._stop:
+            raise IndexError(
+                f"Board {index} is outside this shard "
+                f"({self._start}-{self._stop - 1})")
+        self._index = index
+
+    def layout(self, index):
+        # Placement indices of the ships of a board, in fleet order
+        return self._layouts[index]
+
+    def next(self):
+
+        index = self._index
+
+        self._index += 1
+        if self._index == self._stop:
+            self._index = self._start
+
+        return index, self._layouts[index]
+
+if __name__ == "__main__":
+    import sys
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    directory = sys.argv[2] if len(sys.argv) > 2 else os.path.join(
+        "..", "TFBattleship_DATA", "board banks")
+
+    print(generate_bank(directory, count))
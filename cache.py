@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import collections
+import sys
+
+class LRUCache:
+
+    # Dictionary of at most maxsize entries that evicts the least recently
+    # used one when full, and counts its hits and misses. nbytes estimates
+    # the memory held by keys and values, including the items of tuple keys.
+
+    def __init__(self, maxsize):
+
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+
+        self._entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def get(self, key, default=None):
+
+        value = self._entries.get(key, self)
+
+        if value is self:
+            self.misses += 1
+            return default
+
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+
+        if key in self._entries:
+            self.nbytes -= _sizeof(key, self._entries[key])
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        self.nbytes += _sizeof(key, value)
+
+        if len(self._entries) > self.maxsize:
+            self.nbytes -= _sizeof(*self._entries.popitem(last=False))
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+
+def _sizeof(key, value):
+    size = sys.getsizeof(key) + sys.getsizeof(value)
+    if isinstance(key, tuple):
+        size += sum(sys.getsizeof(item) for item in key)
+    return size
+
+def board_key(observation):
+    # Identifies a position by its observation. Ships can't touch, so the
+    # sunk ones, and with them the ships still afloat, are on the board.
+    return observation.tobytes()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+# Board observations, one cell value (0-3, see board.py) per cell
+INT32 = "int32"
+UINT8 = "uint8"
+# One-hot planes (unknown, miss, hit, sunk), bit-packed into bytes, bit
+# plane * size + cell of the flattened planes at bit i % 8 of byte i // 8
+PLANES = "planes"
+
+ENCODINGS = (INT32, UINT8, PLANES)
+
+NUM_PLANES = 4
+
+def _check(encoding):
+    if encoding not in ENCODINGS:
+        raise ValueError(
+            f"Unknown observation encoding {encoding!r}, "
+            f"expected one of {ENCODINGS}")
+
+def encoded_shape(shape, encoding):
+    _check(encoding)
+    if encoding == PLANES:
+        return ((NUM_PLANES * shape[0] * shape[1] + 7) // 8,)
+    return tuple(shape)
+
+def encoded_dtype(encoding):
+    _check(encoding)
+    return np.int32 if encoding == INT32 else np.uint8
+
+def encoded_maximum(encoding):
+    _check(encoding)
+    return 255 if encoding == PLANES else 3
+
+def encode(boards, encoding, out=None):
+
+    # Encodes boards of shape (..., rows, cols), into out if given
+
+    _check(encoding)
+
+    if encoding != PLANES:
+        if out is None:
+            return boards.astype(encoded_dtype(encoding))
+        np.copyto(out, boards, casting="unsafe")
+        return out
+
+    planes = np.moveaxis(
+        np.arange(NUM_PLANES) == boards[..., None], -1, -3)
+    packed = np.packbits(
+        planes.reshape(boards.shape[:-2] + (-1,)), axis=-1, bitorder="little")
+
+    if out is None:
+        return packed
+    out[...] = packed
+    return out
+
+def decode(observations, shape, encoding):
+
+    # Float32 planes of shape (..., rows, cols, 4) from encoded observations
+
+    _check(encoding)
+
+    if encoding != PLANES:
+        return (
+            np.arange(NUM_PLANES) == observations[..., None]
+            ).astype(np.float32)
+
+    size = shape[0] * shape[1]
+    bits = np.unpackbits(
+        observations, axis=-1, count=NUM_PLANES * size, bitorder="little")
+
+    return np.moveaxis(
+        bits.reshape(observations.shape[:-1] + (NUM_PLANES,) + tuple(shape)),
+        -3, -1
+        ).astype(np.float32)
+
+def tf_decode(observations, shape, encoding):
+
+    # Same as decode, as TF ops, for use as a network preprocessing layer
+
+    import tensorflow as tf
+
+    _check(encoding)
+
+    if encoding != PLANES:
+        return tf.one_hot(tf.cast(observations, tf.int32), NUM_PLANES)
+
+    size = shape[0] * shape[1]
+    bits = tf.bitwise.bitwise_and(
+        tf.bitwise.right_shift(
+            tf.cast(observations, tf.int32)[..., None], tf.range(8)),
+        1)
+    bits = tf.reshape(bits, tf.concat([tf.shape(observations)[:-1], [-1]], 0))
+    planes = tf.reshape(
+        bits[..., :NUM_PLANES * size],
+        tf.concat([tf.shape(observations)[:-1], [NUM_PLANES, shape[0], shape[1]]], 0))
+
+    rank = len(planes.shape)
+    return tf.cast(
+        tf.transpose(
+            planes, list(range(rank - 3)) + [rank - 2, rank - 1, rank - 3]),
+        tf.float32)
+
+def tf_encode(boards, encoding):
+
+    # Same as encode, as TF ops on int32 boards of shape (batch, rows, cols)
+
+    import tensorflow as tf
+
+    _check(encoding)
+
+    if encoding == INT32:
+        return boards
+    if encoding == UINT8:
+        return tf.cast(boards, tf.uint8)
+
+    batch_size = tf.shape(boards)[0]
+    size = boards.shape[1] * boards.shape[2]
+    nbytes = (NUM_PLANES * size + 7) // 8
+
+    planes = tf.transpose(
+        tf.one_hot(tf.reshape(boards, (batch_size, size)), NUM_PLANES,
+                   dtype=tf.int32),
+        (0, 2, 1))
+    bits = tf.pad(
+        tf.reshape(planes, (batch_size, NUM_PLANES * size)),
+        [[0, 0], [0, nbytes * 8 - NUM_PLANES * size]])
+    bits = tf.reshape(bits, (batch_size, nbytes, 8))
+
+    return tf.cast(
+        tf.reduce_sum(tf.bitwise.left_shift(bits, tf.range(8)), axis=-1),
+        tf.uint8)
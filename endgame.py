@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from cache import LRUCache
+from placement import placement_table
+
+# Positions with at most this many consistent layouts are solved exactly
+ENDGAME_LAYOUTS = 8
+# Gives up on a position after solving this many positions under it
+MAX_NODES = 5_000
+# Positions aren't enumerated when placing each remaining ship on its
+# own gives more than this many times ENDGAME_LAYOUTS combinations
+BOUND_SLACK = 100
+# Solved positions kept in the transposition table
+TABLE_SIZE = 200_000
+
+class _OutOfNodes(Exception):
+    pass
+
+class EndgameSolver:
+
+    # Finds the shot that minimizes the expected number of shots left, with
+    # every layout of the remaining ships that is consistent with the board
+    # taken as equally likely. Each shot splits the layouts into a miss, a
+    # hit and one sunk outcome per ship it could sink, and the solver
+    # recurses into each. Positions are bitboards (bit row * cols + col) of
+    # misses, hits of ships afloat and sunk ships, plus the remaining fleet
+    # as a sorted tuple. Solved positions go into an LRU transposition
+    # table, shared by every game the solver plays.
+
+    def __init__(
+            self, ships, shape=(10, 10),
+            max_layouts=ENDGAME_LAYOUTS, max_nodes=MAX_NODES,
+            table_size=TABLE_SIZE):
+
+        self.shape = tuple(shape)
+        self.max_layouts = max_layouts
+        self.max_nodes = max_nodes
+        self.table = LRUCache(table_size)
+
+        self._placements = placement_table(self.shape, ships)
+
+    def solve(self, misses, hits, sunk, remaining, blocked):
+
+        # Returns (expected shots left, cell to shoot) for a position, or
+        # None if it has more than max_layouts layouts or takes more than
+        # max_nodes positions to solve. blocked holds the cells no remaining
+        # ship can be on: misses and the cells around sunk ships.
+
+        remaining = tuple(sorted(remaining))
+        key = (misses, hits, sunk, remaining)
+
+        solved = self.table.get(key)
+        if solved is not None:
+            return solved
+
+        # Cheap upper bound first: each ship placed on its own
+        bound = 1
+        for length in remaining:
+            bound *= sum(
+                1 for pid in self._placements.legal(length, blocked)
+                if not self._placements.halos[pid] & hits
+                & ~self._placements.masks[pid])
+        if bound > self.max_layouts * BOUND_SLACK:
+            return None
+
+        layouts = self._placements.consistent_layouts(
+            remaining, blocked, hits, self.max_layouts)
+
+        if not layouts:
+            return None
+
+        # Positions solved before running out are exact, and stay cached
+        self._nodes = 0
+        try:
+            return self._solve(misses, hits, sunk, remaining, blocked, layouts)
+        except _OutOfNodes:
+            return None
+
+    def _solve(self, misses, hits, sunk, remaining, blocked, layouts):
+
+        self._nodes += 1
+        if self._nodes > self.max_nodes:
+            raise _OutOfNodes
+
+        key = (misses, hits, sunk, remaining)
+        masks = self._placements.masks
+
+        occupied = [0] * len(layouts)
+        for index, layout in enumerate(layouts):
+            for pid in layout:
+                occupied[index] |= masks[pid]
+
+        if len(layouts) == 1:
+            # Only the ship cells not hit yet are left to shoot
+            left = occupied[0] & ~hits
+            solved = (bin(left).count("1"), (left & -left).bit_length() - 1)
+            self.table.put(key, solved)
+            return solved
+
+        # Cells no layout has a ship on can only miss, and tell nothing
+        candidates = 0
+        for cells in occupied:
+            candidates |= cells
+        candidates &= ~hits
+
+        # Most likely hits first, so the bound below prunes early
+        cells = []
+        while candidates:
+            bit = candidates & -candidates
+            candidates ^= bit
+            cells.append((
+                -sum(1 for layout_cells in occupied if layout_cells & bit),
+                bit.bit_length() - 1))
+        cells.sort()
+
+        # Ship cells still to be hit, a lower bound on the shots left
+        to_hit = sum(remaining) - bin(hits).count("1")
+
+        best = (float("inf"), None)
+
+        for _, cell in cells:
+
+            bit = 1 << cell
+            outcomes = self._outcomes(
+                bit, misses, hits, sunk, remaining, blocked, layouts, occupied)
+
+            # Lower bound for this shot: a miss leaves every ship cell to
+            # hit, a hit or a sink one fewer
+            expected = 1 + sum(
+                len(group) * (to_hit - shot_hit)
+                for shot_hit, _, group in outcomes) / len(layouts)
+            if expected >= best[0]:
+                continue
+
+            expected = 1.0
+            for _, position, group in outcomes:
+                # Nothing left to shoot once the last ship is sunk
+                if position[3]:
+                    solved = self.table.get(position[:4]) \
+                        or self._solve(*position, group)
+                    expected += len(group) / len(layouts) * solved[0]
+                if expected >= best[0]:
+                    break
+            else:
+                best = (expected, cell)
+
+        self.table.put(key, best)
+        return best
+
+    def _outcomes(self, bit, misses, hits, sunk, remaining, blocked, layouts,
+                  occupied):
+
+        # Splits the layouts by what shooting bit would show, as
+        # (whether it hits, next position, layouts) per outcome
+
+        placements = self._placements
+
+        missed = []
+        hit = []
+        sinks = {}
+
+        for layout, cells in zip(layouts, occupied):
+
+            if not cells & bit:
+                missed.append(layout)
+                continue
+
+            pid = next(pid for pid in layout if placements.masks[pid] & bit)
+
+            if placements.masks[pid] & ~(hits | bit):
+                hit.append(layout)
+            else:
+                sinks.setdefault(pid, []).append(
+                    tuple(other for other in layout if other != pid))
+
+        outcomes = []
+
+        if missed:
+            outcomes.append((
+                False,
+                (misses | bit, hits, sunk, remaining, blocked | bit),
+                missed))
+
+        if hit:
+            outcomes.append((
+                True,
+                (misses, hits | bit, sunk, remaining, blocked),
+                hit))
+
+        for pid, group in sinks.items():
+            mask = placements.masks[pid]
+            left = list(remaining)
+            left.remove(placements.lengths[pid])
+            outcomes.append((
+                True,
+                (misses, hits & ~mask, sunk | mask, tuple(left),
+                 blocked | placements.halos[pid]),
+                group))
+
+        return outcomes
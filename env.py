@@ -1,130 +1,93 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import numpy as np
-
 from tf_agents.environments import py_environment
 from tf_agents.environments import utils
 from tf_agents.specs import array_spec
 from tf_agents.trajectories import time_step as ts
 
-class PyBattleshipEnv(py_environment.PyEnvironment):
-
-    class Ship:
-
-        def __init__(self, location, direction, length):
-
-            self._sunk = False
-
-            self._status = {}
-
-            for offset in range(length):
-                self._status[
-                    tuple(np.add(
-                        location,
-                        np.array(
-                            [offset * direction, offset * (not direction)]
-                            )
-                        ))
-                    ] = True
+from game import BattleshipGame, BatchedBattleshipGame
 
-        def attack(self, location):
+# tf_agents adapters around the games of game.py, which hold the rules.
+# Only code that trains or evaluates policies needs to import this module.
 
-            location = tuple(location)
+def _array_spec(spec):
+    # game.BoundedSpec, or a dict of them, as tf_agents array specs
+    if isinstance(spec, dict):
+        return {key: _array_spec(value) for key, value in spec.items()}
+    return array_spec.BoundedArraySpec(**spec._asdict())
 
-            if self._sunk:
-                return 0
-
-            if self._status.get(location):
-                self._status[location] = False
-
-                if not any(self._status.values()):
-                    self._sunk = True
-                    return 2
-
-                return 1
-
-            return 0
+class PyBattleshipEnv(py_environment.PyEnvironment):
 
-        def check(self, location):
+    # Takes the arguments of game.BattleshipGame
 
-            location = tuple(location)
+    Ship = BattleshipGame.Ship
 
-            return location in self._status.keys()
+    def __init__(self, *args, **kwargs):
 
-        @property
-        def sunk(self):
-            return self._sunk
+        super().__init__()
 
-        @property
-        def locations(self):
-            return tuple(self._status.keys())
+        self._game = BattleshipGame(*args, **kwargs)
+        self._action_spec = _array_spec(self._game.action_spec())
+        self._observation_spec = _array_spec(self._game.observation_spec())
 
-        def __bool__(self):
-            return not self.sunk
+    @property
+    def game(self):
+        return self._game
 
-        def __repr__(self):
-            return f"{sum(self._status.values())}/{len(self._status)}"
+    @property
+    def board(self):
+        return self._game.board
 
-        def __len__(self):
-            return len(self._status)
+    @property
+    def board_index(self):
+        return self._game.board_index
 
+    @property
+    def _ships(self):
+        # The game's Ship views, where scripts written against the old env
+        # still look for them
+        return self._game._ships
 
-    def __init__(
-            self, ships = None,
-            skip_invalid_actions = False,
-            punish_invalid_actions = False):
+    def action_spec(self):
+        return self._action_spec
 
-        if ships is None:
-            ships = [5, 4, 3, 3, 2]
+    def observation_spec(self):
+        return self._observation_spec
 
-        self._action_spec = array_spec.BoundedArraySpec(
-            shape=(), dtype=np.int32, minimum=0, maximum=99, name='action')
+    def _reset(self):
+        return ts.TimeStep(*self._game.reset())
 
-        self._observation_spec = array_spec.BoundedArraySpec(
-            shape=(10,10), dtype=np.int32, minimum=0, maximum=3, name='observation')
+    def _step(self, action):
+        return ts.TimeStep(*self._game.step(action))
 
-        self._episode_ended = False
+class BatchedPyBattleshipEnv(py_environment.PyEnvironment):
 
-        self._state = np.zeros(shape=(10,10), dtype=np.int32)
+    # Takes the arguments of game.BatchedBattleshipGame
 
-        self._already_taken_actions = []
-        self._skip_invalid_actions = skip_invalid_actions
-        self._punish_invalid_actions = punish_invalid_actions
+    def __init__(self, *args, **kwargs):
 
-        self._ships = []
+        super().__init__()
 
-        mask = np.zeros((10,10), dtype=bool)
+        self._game = BatchedBattleshipGame(*args, **kwargs)
+        self._action_spec = _array_spec(self._game.action_spec())
+        self._observation_spec = _array_spec(self._game.observation_spec())
 
-        for length in ships:
+    @property
+    def game(self):
+        return self._game
 
-            coords = np.random.randint(0, 10, 2)
-            direction = np.random.randint(0, 2)
-            while coords[0] + (length - 1) * direction > 9 or coords[1] + (length - 1) * (not direction) > 9:
-                coords = np.random.randint(0, 9, 2)
-                direction = np.random.randint(0, 2)
-            while any([mask[coords[0] + offset * direction, coords[1] + offset * (not direction)] for offset in range(length)]):
-                coords = np.random.randint(0, 9, 2)
-                direction = np.random.randint(0, 2)
-                while coords[0] + (length - 1) * direction > 9 or coords[1] + (length - 1) * (not direction) > 9:
-                    coords = np.random.randint(0, 9, 2)
-                    direction = np.random.randint(0, 2)
+    @property
+    def batched(self):
+        return True
 
-            self._ships.append(self.Ship(coords, direction, length))
+    @property
+    def batch_size(self):
+        return self._game.batch_size
 
-            for offset in range(-1, length + 1):
-                try:
-                    mask[coords[0] + offset * direction, coords[1] + offset * (not direction)] = True
-                except IndexError:
-                    pass
-                try:
-                    mask[coords[0] + offset * direction + (not direction), coords[1] + offset * (not direction) + direction] = True
-                except IndexError:
-                    pass
-                try:
-                    mask[coords[0] + offset * direction - (not direction), coords[1] + offset * (not direction) - direction] = True
-                except IndexError:
-                    pass
+    @property
+    def board_index(self):
+        return self._game.board_index
 
     def action_spec(self):
         return self._action_spec
@@ -133,51 +96,10 @@ class PyBattleshipEnv(py_environment.PyEnvironment):
         return self._observation_spec
 
     def _reset(self):
-        self.__init__(
-            ships = [len(ship) for ship in self._ships],
-            skip_invalid_actions = self._skip_invalid_actions,
-            punish_invalid_actions=self._punish_invalid_actions
-            )
-        return ts.restart(self._state)
+        return ts.TimeStep(*self._game.reset())
 
     def _step(self, action):
-
-        if self._episode_ended:
-            return self._reset()
-
-        if not isinstance(action, tuple):
-            action = [int(action // 10), int(action % 10)]
-
-        if self._punish_invalid_actions and action in self._already_taken_actions:
-            return ts.transition(self._state, -1)
-
-        if self._skip_invalid_actions:
-            while action in self._already_taken_actions:
-                if action[0] < 9:
-                    action = [action[0] + 1, action[1]]
-                elif action[1] < 9:
-                    action = [0, action[1] + 1]
-                else:
-                    action = [0, 0]
-
-            self._already_taken_actions.append(action)
-
-        self._state[action[0], action[1]] = 1
-
-        for ship in self._ships:
-            res = ship.attack(action)
-            if res:
-                self._state[action[0], action[1]] = 2
-                if res == 2:
-                    for location in ship.locations:
-                        self._state[location[0], location[1]] = 3
-                break
-
-        if np.any(self._ships):
-            return ts.transition(self._state, bool(res))
-
-        self._episode_ended = True
-        return ts.termination(self._state, bool(res))
+        return ts.TimeStep(*self._game.step(action))
 
 if __name__ == "__main__":
     env = PyBattleshipEnv(skip_invalid_actions=True)
@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import os
+import time
+
+import numpy as np
+
+from game import BatchedBattleshipGame, StepType
+from placement import placement_table
+from saving import StatsLog
+from tournament import GAMES_PER_TASK, _layouts, summarize
+
+# Boards every policy is played on, all at once
+EVAL_EPISODES = 500
+# Seconds between looks for new policy saves when watching
+POLL_INTERVAL = 30
+# Niceness of the service, so it gets the CPU the learner leaves
+EVAL_NICENESS = 10
+
+class FixedBoards:
+
+    # The same count boards for every policy, in order, as a board bank for
+    # BatchedBattleshipGame. Seeded chunk by chunk like the tournament, so
+    # policies are scored on the boards the algorithms are with that seed.
+
+    def __init__(
+            self, count=EVAL_EPISODES,
+            shape=(10, 10), ships=(5, 4, 3, 3, 2), seed=0):
+
+        self.shape = tuple(shape)
+        self.ships = tuple(ships)
+        self.placements = placement_table(self.shape, self.ships)
+
+        self._layouts = [
+            layout
+            for chunk, start in enumerate(range(0, count, GAMES_PER_TASK))
+            for layout in _layouts(
+                self.shape, self.ships, seed, chunk,
+                min(GAMES_PER_TASK, count - start))
+            ]
+        self._index = 0
+
+    def __len__(self):
+        return len(self._layouts)
+
+    def reset(self):
+        # Starts again from the first board
+        self._index = 0
+
+    def next(self):
+        index = self._index
+        self._index = (index + 1) % len(self._layouts)
+        return index, self._layouts[index]
+
+def policy_dir(directory, name):
+    return os.path.join(directory, name + " data", "policy saves")
+
+def eval_dir(directory, name):
+    return os.path.join(directory, name + " data", "eval")
+
+def scores_path(directory, name, step):
+    return os.path.join(eval_dir(directory, name), f"scores @ {step}.npz")
+
+def saved_policies(directory, name):
+
+    # (step, path) of every finished policy save, oldest first. The agent
+    # renames a save into place once it's written, so half written ones
+    # don't match.
+
+    policies = policy_dir(directory, name)
+    if not os.path.isdir(policies):
+        return []
+
+    saves = []
+    for entry in os.listdir(policies):
+        prefix, _, step = entry.rpartition(" @ ")
+        if prefix == name + " policy" and step.isdigit():
+            saves.append((int(step), os.path.join(policies, entry)))
+
+    return sorted(saves)
+
+def load_policy(path):
+
+    # Imported here so the rest of the module works without TF. Time
+    # steps come from a batched game, so already have a batch dimension.
+
+    from tf_agents.policies import py_tf_eager_policy
+
+    return py_tf_eager_policy.SavedModelPyTFEagerPolicy(
+        path, load_specs_from_pbtxt=True, batch_time_steps=False)
+
+def game_options(policy):
+
+    # Legal action masking and observation encoding the policy was saved
+    # with, from its observation spec
+
+    from encoding import INT32, PLANES, UINT8
+
+    spec = policy.time_step_spec.observation
+    masked = isinstance(spec, dict)
+    if masked:
+        spec = spec['observation']
+
+    if spec.dtype == np.int32:
+        encoding = INT32
+    elif len(spec.shape) == 2:
+        encoding = UINT8
+    else:
+        encoding = PLANES
+
+    return {"observe_legal_actions": masked, "observation_encoding": encoding}
+
+def play(policy, boards, duration=100, skip_invalid_actions=False):
+
+    # Plays one episode on every board at once and returns the index of
+    # the board in each slot, the shots each took, whether each was sunk
+    # within duration shots, and the seconds spent in the policy
+
+    from tf_agents.trajectories import time_step as ts
+
+    game = BatchedBattleshipGame(
+        len(boards), list(boards.ships),
+        skip_invalid_actions=skip_invalid_actions,
+        board_bank=boards,
+        shape=boards.shape,
+        duration=duration,
+        **game_options(policy))
+
+    shots = np.zeros(len(boards), dtype=np.int64)
+    finished = np.zeros(len(boards), dtype=bool)
+    done = np.zeros(len(boards), dtype=bool)
+    thinking = 0.0
+
+    # The game took boards on creation, and auto-restarts keep taking
+    # them, so every play starts over from the first
+    boards.reset()
+    time_step = game.reset()
+    board_index = game.board_index.copy()
+    step = 0
+
+    while not done.all():
+
+        start = time.perf_counter()
+        action = policy.action(ts.TimeStep(*time_step)).action
+        thinking += time.perf_counter() - start
+
+        time_step = game.step(action)
+        step += 1
+
+        # Boards that ended restart, only their first episode counts
+        ended = (time_step.step_type == StepType.LAST) & ~done
+        shots[ended] = step
+        finished[ended] = time_step.discount[ended] == 0
+        done |= ended
+
+    return board_index, shots, finished, thinking
+
+def evaluate_policy(path, boards, **kwargs):
+
+    started = time.perf_counter()
+    board_index, shots, finished, thinking = play(
+        load_policy(path), boards, **kwargs)
+
+    summary = summarize(shots, thinking, time.perf_counter() - started)
+    summary["finished"] = float(finished.mean())
+
+    return {"boards": board_index, "shots": shots, "finished": finished}, \
+        summary
+
+def evaluate_saves(
+        directory, name, boards, watch=False, learner=None,
+        poll_interval=POLL_INTERVAL, **kwargs):
+
+    # Evaluates every policy save of the run that has no scores yet. When
+    # watching, keeps looking for new saves until the learner process
+    # exits, then evaluates what it left and returns.
+
+    stats = StatsLog(eval_dir(directory, name))
+
+    while True:
+
+        learner_alive = learner is not None and _alive(learner)
+
+        for step, path in saved_policies(directory, name):
+
+            output = scores_path(directory, name, step)
+            if os.path.exists(output):
+                continue
+
+            scores, summary = evaluate_policy(path, boards, **kwargs)
+            low, high = summary["ci95"]
+
+            stats.append(
+                "summary", step=step, games=summary["games"],
+                mean=summary["mean"], std=summary["std"],
+                ci95_low=low, ci95_high=high,
+                **{f"p{q}": value
+                   for q, value in summary["percentiles"].items()},
+                min=summary["min"], max=summary["max"],
+                finished=summary["finished"],
+                us_per_move=summary["us_per_move"])
+            stats.write(stats.take())
+
+            # Per board, with the boards' indices, so distributions can be
+            # compared board by board
+            np.savez(output, **scores)
+
+            print(f"step {step}: {summary['mean']:.2f} shots "
+                  f"(95% CI {low:.2f}-{high:.2f}, "
+                  f"median {summary['percentiles']['50']:.0f}, "
+                  f"{summary['finished']:.0%} finished)", flush=True)
+
+        if not watch or (learner is not None and not learner_alive):
+            return
+
+        time.sleep(poll_interval)
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Scores a run's saved policies on the same seeded boards")
+    parser.add_argument("name", help="NAME of the run in agent.py")
+    parser.add_argument("--directory", default=os.path.join(
+        "..", "TFBattleship_DATA"))
+    parser.add_argument("--episodes", type=int, default=EVAL_EPISODES)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--shape", type=int, nargs=2, default=(10, 10))
+    parser.add_argument("--ships", type=int, nargs="+", default=(5, 4, 3, 3, 2))
+    parser.add_argument("--duration", type=int, default=100)
+    parser.add_argument("--skip-invalid-actions", action="store_true")
+    parser.add_argument("--watch", action="store_true",
+                        help="keep evaluating new saves as they appear")
+    parser.add_argument("--learner", type=int, default=None,
+                        help="pid of the training process; when watching, "
+                             "stop once it has exited")
+    parser.add_argument("--poll-interval", type=float, default=POLL_INTERVAL)
+    parser.add_argument("--nice", type=int, default=EVAL_NICENESS)
+    args = parser.parse_args()
+
+    if args.nice:
+        os.nice(args.nice)
+
+    evaluate_saves(
+        args.directory, args.name,
+        FixedBoards(args.episodes, args.shape, args.ships, args.seed),
+        watch=args.watch, learner=args.learner,
+        poll_interval=args.poll_interval,
+        duration=args.duration,
+        skip_invalid_actions=args.skip_invalid_actions)
@@ -0,0 +1,486 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import collections
+
+import numpy as np
+
+from board import Board, UNKNOWN, MISS, HIT, SUNK
+from encoding import (
+    INT32, encode, encoded_dtype, encoded_maximum, encoded_shape)
+from placement import placement_table
+
+# The game rules behind the envs, on NumPy only. Time steps and specs have
+# the same fields and dtypes as tf_agents' ones, so env.py only has to wrap
+# them, but nothing here imports tf_agents, which takes seconds to load.
+# Scripts that don't train, like algorithms.py, ui.py and the benchmarks,
+# play on these directly.
+
+class StepType:
+    # Same values as tf_agents' ts.StepType
+    FIRST = np.asarray(0, dtype=np.int32)
+    MID = np.asarray(1, dtype=np.int32)
+    LAST = np.asarray(2, dtype=np.int32)
+
+class TimeStep(collections.namedtuple(
+        "TimeStep", ["step_type", "reward", "discount", "observation"])):
+
+    __slots__ = ()
+
+    def is_first(self):
+        return np.equal(self.step_type, StepType.FIRST)
+
+    def is_mid(self):
+        return np.equal(self.step_type, StepType.MID)
+
+    def is_last(self):
+        return np.equal(self.step_type, StepType.LAST)
+
+BoundedSpec = collections.namedtuple(
+    "BoundedSpec", ["shape", "dtype", "minimum", "maximum", "name"])
+
+def restart(observation):
+    return TimeStep(
+        StepType.FIRST, np.asarray(0.0, dtype=np.float32),
+        np.asarray(1.0, dtype=np.float32), observation)
+
+def transition(observation, reward):
+    return TimeStep(
+        StepType.MID, np.asarray(reward, dtype=np.float32),
+        np.asarray(1.0, dtype=np.float32), observation)
+
+def termination(observation, reward):
+    return TimeStep(
+        StepType.LAST, np.asarray(reward, dtype=np.float32),
+        np.asarray(0.0, dtype=np.float32), observation)
+
+def _check_bank(board_bank, shape, ships):
+    # A bank's layouts are placement indices for its own board and fleet,
+    # so on any other they would be silently wrong games
+    if tuple(board_bank.shape) != tuple(shape) \
+            or tuple(board_bank.ships) != tuple(int(ship) for ship in ships):
+        raise ValueError(
+            f"Board bank holds {board_bank.shape[0]}x{board_bank.shape[1]} "
+            f"boards of fleet {list(board_bank.ships)}, not "
+            f"{shape[0]}x{shape[1]} boards of fleet {list(ships)}")
+
+class BattleshipGame:
+
+    class Ship:
+
+        # Read-only view of one ship of the env's fleet. The env itself only
+        # works on the bitboards of its Board, these are kept for
+        # inspecting the board.
+
+        def __init__(self, game, index):
+
+            self._game = game
+            self._index = index
+
+        def check(self, location):
+
+            location = tuple(location)
+
+            return location in self.locations
+
+        @property
+        def sunk(self):
+            return not self._game._board.hits_left[self._index]
+
+        @property
+        def locations(self):
+            board = self._game._board
+            return tuple(
+                zip(*(axis.tolist() for axis in
+                      board.placements.coords[board.layout[self._index]]))
+                )
+
+        def __bool__(self):
+            return not self.sunk
+
+        def __repr__(self):
+            return f"{self._game._board.hits_left[self._index]}/{len(self)}"
+
+        def __len__(self):
+            return self._game._board.ships[self._index]
+
+
+    def __init__(
+            self, ships = None,
+            skip_invalid_actions = False,
+            punish_invalid_actions = False,
+            board_bank = None,
+            shape = (10, 10),
+            observe_legal_actions = False,
+            observation_encoding = INT32):
+
+        if ships is None:
+            ships = [5, 4, 3, 3, 2]
+
+        # Boards come from the bank when one is given, see boardbank.py
+        self._board_bank = board_bank
+        self._board_index = None
+
+        if board_bank is None:
+            self._board = Board(shape, ships)
+        else:
+            _check_bank(board_bank, shape, ships)
+            self._board = Board(
+                board_bank.shape, ships, placements=board_bank.placements)
+
+        rows, cols = self._board.shape
+
+        self._action_spec = BoundedSpec(
+            shape=(), dtype=np.int32, minimum=0, maximum=rows * cols - 1,
+            name='action')
+
+        # See encoding.py for the compact encodings
+        self._encoding = observation_encoding
+
+        self._observation_spec = BoundedSpec(
+            shape=encoded_shape((rows, cols), observation_encoding),
+            dtype=encoded_dtype(observation_encoding),
+            minimum=0, maximum=encoded_maximum(observation_encoding),
+            name='observation')
+
+        self._episode_ended = False
+
+        self._state = self._board.observation
+
+        if observation_encoding == INT32:
+            self._encoded_state = self._state
+        else:
+            self._encoded_state = np.zeros(
+                self._observation_spec.shape, self._observation_spec.dtype)
+
+        self._observation = self._encoded_state
+
+        # 1 for every cell that hasn't been shot yet, for policies to mask
+        # their actions with
+        self._legal_actions = np.ones(rows * cols, dtype=np.uint8)
+
+        if observe_legal_actions:
+            self._observation_spec = {
+                'observation': self._observation_spec,
+                'legal_actions': BoundedSpec(
+                    shape=(rows * cols,), dtype=np.uint8, minimum=0,
+                    maximum=1, name='legal_actions')
+                }
+            self._observation = {
+                'observation': self._encoded_state,
+                'legal_actions': self._legal_actions
+                }
+
+        self._skip_invalid_actions = skip_invalid_actions
+        self._punish_invalid_actions = punish_invalid_actions
+
+        self._new_board()
+
+        self._ships = [self.Ship(self, index) for index in range(len(ships))]
+
+    @property
+    def board(self):
+        return self._board
+
+    def action_spec(self):
+        return self._action_spec
+
+    def observation_spec(self):
+        return self._observation_spec
+
+    @property
+    def board_index(self):
+        # Index of the current board in the board bank, if one is used
+        return self._board_index
+
+    def _new_board(self):
+
+        # Reuses every buffer of the previous episode, including _state,
+        # so observations of the old episode are overwritten as well
+
+        if self._board_bank is None:
+            self._board.reset()
+        else:
+            self._board_index, layout = self._board_bank.next()
+            self._board.reset(layout)
+
+    def _observe(self):
+        if self._encoding != INT32:
+            encode(self._state, self._encoding, out=self._encoded_state)
+        return self._observation
+
+    def reset(self):
+        self._episode_ended = False
+        self._legal_actions.fill(1)
+        self._new_board()
+        return restart(self._observe())
+
+    def step(self, action):
+
+        if self._episode_ended:
+            return self.reset()
+
+        board = self._board
+        rows, cols = board.shape
+
+        if isinstance(action, tuple):
+            action = action[0] * cols + action[1]
+        else:
+            action = int(action)
+
+        taken = board.taken
+
+        if self._punish_invalid_actions and taken >> action & 1:
+            return transition(self._observe(), -1)
+
+        if self._skip_invalid_actions:
+            # Probes down the column, then on to the top of the next one
+            while taken >> action & 1:
+                if action < (rows - 1) * cols:
+                    action += cols
+                elif action < rows * cols - 1:
+                    action = action - (rows - 1) * cols + 1
+                else:
+                    action = 0
+
+        # A cell that was already shot comes back UNKNOWN, and is a miss
+        res = board.shoot(action)
+        self._legal_actions[action] = 0
+
+        if res != SUNK or board.ships_left:
+            return transition(self._observe(), res in (HIT, SUNK))
+
+        self._episode_ended = True
+        return termination(self._observe(), True)
+
+class BatchedBattleshipGame:
+
+    # Plays batch_size independent games. Every board lives in a slice of
+    # stacked arrays, so a step resolves all shots with a handful of
+    # vectorized operations instead of per-game Python work.
+
+    def __init__(
+            self, batch_size, ships = None,
+            skip_invalid_actions = False,
+            punish_invalid_actions = False,
+            board_bank = None,
+            shape = (10, 10),
+            duration = None,
+            observe_legal_actions = False,
+            observation_encoding = INT32,
+            random_state = None):
+
+        if ships is None:
+            ships = [5, 4, 3, 3, 2]
+
+        self._batch_size = batch_size
+        # Fleets are sampled with random_state, or np.random without one.
+        # Games in different processes need their own, a forked process
+        # starts with a copy of its parent's np.random.
+        self._random_state = np.random if random_state is None \
+            else random_state
+        self._ship_lengths = np.array(ships, dtype=np.int8)
+        self._board_bank = board_bank
+        if board_bank is None:
+            self._placements = placement_table(shape, ships)
+        else:
+            _check_bank(board_bank, shape, ships)
+            self._placements = board_bank.placements
+
+        self._shape = rows, cols = self._placements.shape
+        self._size = size = rows * cols
+        # Bank index of every board's layout, -1 for sampled ones
+        self._board_index = np.full(batch_size, -1, dtype=np.int64)
+
+        self._action_spec = BoundedSpec(
+            shape=(), dtype=np.int32, minimum=0, maximum=size - 1,
+            name='action')
+
+        self._encoding = observation_encoding
+
+        self._observation_spec = BoundedSpec(
+            shape=encoded_shape((rows, cols), observation_encoding),
+            dtype=encoded_dtype(observation_encoding),
+            minimum=0, maximum=encoded_maximum(observation_encoding),
+            name='observation')
+
+        self._skip_invalid_actions = skip_invalid_actions
+        self._punish_invalid_actions = punish_invalid_actions
+
+        self._state = np.zeros((batch_size, rows, cols), dtype=np.int32)
+        # Flat (batch_size, size) view of the boards, shares memory with _state
+        self._cells = self._state.reshape(batch_size, size)
+
+        if observation_encoding == INT32:
+            self._encoded_state = self._state
+        else:
+            self._encoded_state = np.zeros(
+                (batch_size,) + self._observation_spec.shape,
+                self._observation_spec.dtype)
+
+        self._observation = self._encoded_state
+
+        # 1 for every cell that hasn't been shot yet
+        self._legal_actions = np.ones((batch_size, size), dtype=np.uint8)
+
+        if observe_legal_actions:
+            self._observation_spec = {
+                'observation': self._observation_spec,
+                'legal_actions': BoundedSpec(
+                    shape=(size,), dtype=np.uint8, minimum=0, maximum=1,
+                    name='legal_actions')
+                }
+            self._observation = {
+                'observation': self._encoded_state,
+                'legal_actions': self._legal_actions
+                }
+
+        # 0 for water, i + 1 for the i-th ship of the fleet
+        self._ship_ids = np.zeros((batch_size, size), dtype=np.int8)
+        self._hits_left = np.zeros((batch_size, len(ships)), dtype=np.int8)
+        self._ships_left = np.zeros(batch_size, dtype=np.int8)
+        self._taken = np.zeros((batch_size, size), dtype=bool)
+
+        self._episode_ended = np.zeros(batch_size, dtype=bool)
+
+        # Ends episodes after this many steps, like wrappers.TimeLimit does
+        # for a single env
+        self._duration = duration
+        self._episode_steps = np.zeros(batch_size, dtype=np.int64)
+
+        self._reset_boards(np.arange(batch_size))
+
+    @property
+    def batched(self):
+        return True
+
+    @property
+    def batch_size(self):
+        return self._batch_size
+
+    @property
+    def board_index(self):
+        return self._board_index
+
+    def action_spec(self):
+        return self._action_spec
+
+    def observation_spec(self):
+        return self._observation_spec
+
+    def _reset_boards(self, boards):
+
+        self._cells[boards] = UNKNOWN
+        self._ship_ids[boards] = 0
+        self._taken[boards] = False
+        self._legal_actions[boards] = 1
+        self._hits_left[boards] = self._ship_lengths
+        self._ships_left[boards] = len(self._ship_lengths)
+        self._episode_ended[boards] = False
+        self._episode_steps[boards] = 0
+
+        for board in boards:
+            if self._board_bank is None:
+                layout = self._placements.sample(
+                    self._ship_lengths, self._random_state)
+            else:
+                self._board_index[board], layout = self._board_bank.next()
+            for ship, pid in enumerate(layout):
+                self._ship_ids[board, self._placements.cells[pid]] = ship + 1
+
+    def _observe(self):
+        if self._encoding != INT32:
+            encode(self._state, self._encoding, out=self._encoded_state)
+        return self._observation
+
+    def reset(self):
+        self._reset_boards(np.arange(self._batch_size))
+        return TimeStep(
+            step_type=np.full(
+                self._batch_size, StepType.FIRST, dtype=np.int32),
+            reward=np.zeros(self._batch_size, dtype=np.float32),
+            discount=np.ones(self._batch_size, dtype=np.float32),
+            observation=self._observe()
+            )
+
+    def _next_free_cells(self, boards, cells):
+
+        # Same probing order as PyBattleshipEnv: down the column, then on
+        # to the top of the next column, wrapping around after the last cell
+        rows, cols = self._shape
+        positions = cells % cols * rows + cells // cols
+        taken = self._taken[boards].reshape(-1, rows, cols).transpose(0, 2, 1)
+        order = (positions[:, None] + np.arange(self._size)) % self._size
+        free = np.argmin(
+            np.take_along_axis(
+                taken.reshape(-1, self._size), order, axis=1),
+            axis=1)
+        positions = order[np.arange(len(boards)), free]
+
+        return positions % rows * cols + positions // rows
+
+    def step(self, action):
+
+        action = np.asarray(action, dtype=np.int64).reshape(self._batch_size)
+
+        step_type = np.full(self._batch_size, StepType.MID, dtype=np.int32)
+        reward = np.zeros(self._batch_size, dtype=np.float32)
+        discount = np.ones(self._batch_size, dtype=np.float32)
+
+        # Boards whose episode ended on the previous step start a new game
+        restart = np.flatnonzero(self._episode_ended)
+        if len(restart):
+            self._reset_boards(restart)
+            step_type[restart] = StepType.FIRST
+
+        boards = np.flatnonzero(step_type == StepType.MID)
+        self._episode_steps[boards] += 1
+        cells = action[boards]
+        taken = self._taken[boards, cells]
+
+        if self._punish_invalid_actions:
+            reward[boards[taken]] = -1
+            boards, cells = boards[~taken], cells[~taken]
+        elif self._skip_invalid_actions:
+            cells[taken] = self._next_free_cells(boards[taken], cells[taken])
+        else:
+            boards, cells = boards[~taken], cells[~taken]
+
+        self._taken[boards, cells] = True
+        self._legal_actions[boards, cells] = 0
+
+        ids = self._ship_ids[boards, cells]
+        hit = ids > 0
+        self._cells[boards, cells] = np.where(hit, HIT, MISS)
+        reward[boards[hit]] = 1
+
+        boards, ships = boards[hit], ids[hit] - 1
+        self._hits_left[boards, ships] -= 1
+
+        sunk = self._hits_left[boards, ships] == 0
+        boards, ships = boards[sunk], ships[sunk]
+        if len(boards):
+            self._cells[boards] = np.where(
+                self._ship_ids[boards] == ships[:, None] + 1,
+                SUNK,
+                self._cells[boards]
+                )
+            self._ships_left[boards] -= 1
+
+            ended = boards[self._ships_left[boards] == 0]
+            self._episode_ended[ended] = True
+            step_type[ended] = StepType.LAST
+            discount[ended] = 0
+
+        if self._duration is not None:
+            # Truncated episodes keep their discount
+            truncated = np.flatnonzero(self._episode_steps >= self._duration)
+            self._episode_ended[truncated] = True
+            step_type[truncated] = StepType.LAST
+
+        return TimeStep(
+            step_type=step_type,
+            reward=reward,
+            discount=discount,
+            observation=self._observe()
+            )
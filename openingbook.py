@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import os
+import pickle
+
+import numpy as np
+
+from algorithms import ALGORITHMS, Cached
+from board import Board
+from cache import board_key
+from game import StepType, TimeStep
+from placement import placement_table
+
+# Algorithms whose moves only depend on the position, so can have a book
+BOOK_ALGORITHMS = ("Alg1", "Density")
+BOOK_MOVES = 12
+BOOK_GAMES = 20_000
+BOOK_DIR = os.path.join("..", "TFBattleship_DATA", "opening books")
+
+def book_path(name, shape=(10, 10), ships=(5, 4, 3, 3, 2), directory=BOOK_DIR):
+    return os.path.join(
+        directory,
+        f"{name} {shape[0]}x{shape[1]} {'-'.join(map(str, ships))}.pkl")
+
+def build_book(
+        name, moves=BOOK_MOVES, games=BOOK_GAMES,
+        shape=(10, 10), ships=(5, 4, 3, 3, 2), seed=0):
+
+    # Plays the first moves of games random games with an algorithm and
+    # returns its move for every position it reached, keyed with
+    # cache.board_key like Cached does
+
+    shape = tuple(shape)
+    ships = tuple(ships)
+
+    bot = ALGORITHMS[name](list(ships), shape)
+    board = Board(shape, ships)
+    placements = placement_table(shape, ships)
+    random_state = np.random.RandomState(seed)
+
+    book = {}
+
+    for _ in range(games):
+
+        board.reset(placements.sample(ships, random_state))
+        time_step = TimeStep(
+            StepType.FIRST, 0.0, 1.0, board.observation)
+
+        for _ in range(moves):
+
+            key = board_key(board.observation)
+
+            action = book.get(key)
+            if action is None:
+                action = int(bot.action(time_step))
+                book[key] = action
+
+            reward = float(board.shoot(action) > 1)
+            if board.all_sunk:
+                break
+            time_step = TimeStep(
+                StepType.MID, reward, 1.0, board.observation)
+
+        bot.action(TimeStep(StepType.LAST, 0.0, 0.0, board.observation))
+
+    return book
+
+def save_book(book, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "wb") as file:
+        pickle.dump(book, file)
+
+def load_book(path):
+    # An empty book if there isn't one yet
+    if not os.path.exists(path):
+        return {}
+    with open(path, "rb") as file:
+        return pickle.load(file)
+
+def cached_with_book(name, ships, shape=(10, 10), directory=BOOK_DIR, **kwargs):
+    # Cached algorithm using the book saved for it, if any
+    return Cached(
+        ALGORITHMS[name], ships, shape,
+        book=load_book(book_path(name, shape, ships, directory)), **kwargs)
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Builds opening books for the stateless algorithms")
+    parser.add_argument("algorithms", nargs="*", default=BOOK_ALGORITHMS)
+    parser.add_argument("--moves", type=int, default=BOOK_MOVES)
+    parser.add_argument("--games", type=int, default=BOOK_GAMES)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--shape", type=int, nargs=2, default=(10, 10))
+    parser.add_argument("--ships", type=int, nargs="+", default=(5, 4, 3, 3, 2))
+    parser.add_argument("--directory", default=BOOK_DIR)
+    args = parser.parse_args()
+
+    for name in args.algorithms:
+        book = build_book(
+            name, args.moves, args.games, args.shape, args.ships, args.seed)
+        path = book_path(name, args.shape, args.ships, args.directory)
+        save_book(book, path)
+        print(f"{name}: {len(book)} positions, saved to {path}")
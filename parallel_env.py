@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import multiprocessing
+
+import numpy as np
+
+from tf_agents.environments import py_environment
+from tf_agents.trajectories import time_step as ts
+
+from env import BatchedPyBattleshipEnv
+import parallel_game
+from parallel_game import CLOSE, RESET, STEP, SharedArray, map_observation
+
+class ParallelBattleshipEnv(py_environment.PyEnvironment):
+
+    # Runs num_workers processes, each stepping a game.BatchedBattleshipGame
+    # of boards_per_worker boards. Actions and time steps are exchanged through
+    # shared memory, so a step costs one short message per worker no matter
+    # how many boards there are. With a board bank directory, every worker
+    # reads its own shard of the bank, otherwise it samples fleets with a
+    # random state of its own, spawned from seed.
+
+    def __init__(
+            self, num_workers, boards_per_worker = 1,
+            board_bank_directory = None,
+            start_method = None,
+            seed = None,
+            **env_kwargs):
+
+        super().__init__()
+
+        self._batch_size = num_workers * boards_per_worker
+
+        # Only used for its specs
+        env = BatchedPyBattleshipEnv(
+            1, **{key: value for key, value in env_kwargs.items()
+                  if key in ("ships", "shape", "observe_legal_actions",
+                             "observation_encoding")})
+        self._action_spec = env.action_spec()
+        self._observation_spec = env.observation_spec()
+
+        context = multiprocessing.get_context(start_method)
+
+        shared = (
+            SharedArray(context, np.int32, (self._batch_size,)),
+            SharedArray(context, np.int32, (self._batch_size,)),
+            SharedArray(context, np.float32, (self._batch_size,)),
+            SharedArray(context, np.float32, (self._batch_size,)),
+            map_observation(
+                lambda spec: SharedArray(
+                    context, spec.dtype, (self._batch_size,) + spec.shape),
+                self._observation_spec),
+            )
+
+        self._action, self._step_type, self._reward, self._discount = (
+            array.array() for array in shared[:4])
+        self._observation = map_observation(
+            lambda array: array.array(), shared[4])
+
+        self._connections = []
+        self._processes = []
+
+        seed_sequences = np.random.SeedSequence(seed).spawn(num_workers)
+
+        for worker in range(num_workers):
+            connection, worker_connection = context.Pipe()
+            boards = slice(
+                worker * boards_per_worker, (worker + 1) * boards_per_worker)
+            process = context.Process(
+                target=parallel_game.worker,
+                args=(worker_connection, shared, boards, dict(env_kwargs),
+                      board_bank_directory, worker, num_workers,
+                      seed_sequences[worker]),
+                daemon=True
+                )
+            process.start()
+            self._connections.append(connection)
+            self._processes.append(process)
+
+    @property
+    def batched(self):
+        return True
+
+    @property
+    def batch_size(self):
+        return self._batch_size
+
+    def action_spec(self):
+        return self._action_spec
+
+    def observation_spec(self):
+        return self._observation_spec
+
+    def _run(self, command):
+
+        for connection in self._connections:
+            connection.send(command)
+        for connection in self._connections:
+            connection.recv()
+
+        return ts.TimeStep(
+            step_type=self._step_type.copy(),
+            reward=self._reward.copy(),
+            discount=self._discount.copy(),
+            observation=map_observation(np.copy, self._observation)
+            )
+
+    def _reset(self):
+        return self._run(RESET)
+
+    def _step(self, action):
+        self._action[:] = np.asarray(action).reshape(self._batch_size)
+        return self._run(STEP)
+
+    def close(self):
+
+        for connection in self._connections:
+            connection.send(CLOSE)
+        for process in self._processes:
+            process.join()
+
+        self._connections = []
+        self._processes = []
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+from boardbank import BoardBank
+from game import BatchedBattleshipGame
+
+# The worker side of parallel_env.ParallelBattleshipEnv, on NumPy only, so
+# worker processes step the games without importing TensorFlow
+
+STEP = 0
+RESET = 1
+CLOSE = 2
+
+class SharedArray:
+
+    # Array in shared memory that survives being sent to a worker
+
+    def __init__(self, context, dtype, shape):
+        self.dtype = np.dtype(dtype)
+        self.shape = tuple(shape)
+        self.buffer = context.RawArray(
+            "b", int(np.prod(shape)) * self.dtype.itemsize)
+
+    def array(self):
+        return np.frombuffer(self.buffer, dtype=self.dtype).reshape(self.shape)
+
+def map_observation(function, *observations):
+    # Observations are an array, or a dict of them with legal actions
+    if isinstance(observations[0], dict):
+        return {
+            key: function(*(observation[key] for observation in observations))
+            for key in observations[0]
+            }
+    return function(*observations)
+
+def worker(
+        connection, shared, boards, game_kwargs, bank_directory, shard,
+        num_shards, seed_sequence):
+
+    game_kwargs["random_state"] = np.random.RandomState(
+        np.random.MT19937(seed_sequence))
+
+    if bank_directory is not None:
+        game_kwargs["board_bank"] = BoardBank(
+            bank_directory,
+            shape=game_kwargs.get("shape", (10, 10)),
+            ships=game_kwargs.get("ships") or (5, 4, 3, 3, 2),
+            shard=shard,
+            num_shards=num_shards
+            )
+
+    game = BatchedBattleshipGame(boards.stop - boards.start, **game_kwargs)
+
+    action, step_type, reward, discount = (
+        array.array()[boards] for array in shared[:4])
+    observation = map_observation(lambda array: array.array()[boards], shared[4])
+
+    while True:
+
+        command = connection.recv()
+
+        if command == CLOSE:
+            break
+
+        if command == STEP:
+            time_step = game.step(action)
+        else:
+            time_step = game.reset()
+
+        step_type[:] = time_step.step_type
+        reward[:] = time_step.reward
+        discount[:] = time_step.discount
+        map_observation(np.copyto, observation, time_step.observation)
+
+        connection.send(None)
+
+    connection.close()
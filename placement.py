@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import functools
+
+import numpy as np
+
+HORIZONTAL = 0
+VERTICAL = 1
+
+class PlacementTable:
+
+    # Every legal (row, col, direction) placement of every ship length on a
+    # board, enumerated once. A placement is identified by its index (pid)
+    # into the table. Cells and no-touch halos are also kept as integer
+    # bitmasks (bit row * cols + col), so checking a placement against the
+    # rest of a fleet is a single AND.
+
+    def __init__(self, shape=(10, 10), lengths=(5, 4, 3, 3, 2)):
+
+        self.shape = tuple(shape)
+        rows, cols = self.shape
+
+        self.origins = []
+        self.directions = []
+        self.lengths = []
+        self.cells = []
+        self.coords = []
+        self.masks = []
+        self.halos = []
+
+        self._by_length = {}
+
+        for length in sorted(set(lengths), reverse=True):
+
+            pids = []
+
+            # A single cell reads the same either way, only list it once
+            directions = (HORIZONTAL,) if length == 1 else (HORIZONTAL, VERTICAL)
+
+            for direction in directions:
+                for row in range(rows - (length - 1) * direction):
+                    for col in range(cols - (length - 1) * (not direction)):
+
+                        offsets = np.arange(length)
+                        ship_rows = row + offsets * direction
+                        ship_cols = col + offsets * (not direction)
+
+                        halo = 0
+                        for halo_row in range(
+                                max(row - 1, 0),
+                                min(ship_rows[-1] + 2, rows)):
+                            for halo_col in range(
+                                    max(col - 1, 0),
+                                    min(ship_cols[-1] + 2, cols)):
+                                halo |= 1 << (halo_row * cols + halo_col)
+
+                        cells = ship_rows * cols + ship_cols
+
+                        pids.append(len(self.masks))
+                        self.origins.append((row, col))
+                        self.directions.append(direction)
+                        self.lengths.append(length)
+                        self.cells.append(cells)
+                        self.coords.append((ship_rows, ship_cols))
+                        self.masks.append(sum(1 << int(cell) for cell in cells))
+                        self.halos.append(halo)
+
+            self._by_length[length] = (
+                pids, [self.masks[pid] for pid in pids])
+
+    def __len__(self):
+        return len(self.masks)
+
+    # Cells and halos as (placements, cells) 0/1 matrices, so placements
+    # can be checked against whole boards with one matrix product
+
+    @functools.cached_property
+    def cell_matrix(self):
+        matrix = np.zeros((len(self), self.shape[0] * self.shape[1]), np.float32)
+        for pid, cells in enumerate(self.cells):
+            matrix[pid, cells] = 1
+        return matrix
+
+    @functools.cached_property
+    def halo_matrix(self):
+        size = self.shape[0] * self.shape[1]
+        return np.array([
+            np.unpackbits(
+                np.frombuffer(halo.to_bytes((size + 7) // 8, 'little'), np.uint8),
+                count=size, bitorder='little')
+            for halo in self.halos
+            ], dtype=np.float32)
+
+    @functools.cached_property
+    def _by_cell(self):
+        # Placements covering each cell
+        by_cell = [[] for _ in range(self.shape[0] * self.shape[1])]
+        for pid, cells in enumerate(self.cells):
+            for cell in cells:
+                by_cell[cell].append(pid)
+        return by_cell
+
+    def placements(self, length):
+        return list(self._by_length[length][0])
+
+    def legal(self, length, forbidden=0):
+        # Placements of the given length not overlapping any forbidden cell
+        pids, masks = self._by_length[length]
+        return [
+            pid for pid, mask in zip(pids, masks) if not mask & forbidden
+            ]
+
+    def sample(self, ships, random_state=np.random):
+
+        # Returns one pid per ship, in fleet order, for a random non-touching
+        # fleet. Each ship is drawn uniformly from the placements that are
+        # still legal. A dead end backtracks to the previous ship, which
+        # then tries its other placements in turn instead of starting over,
+        # so the search always terminates.
+
+        ships = tuple(int(ship) for ship in ships)
+
+        if sum(ships) > self.shape[0] * self.shape[1]:
+            raise ValueError(
+                f"Fleet {list(ships)} does not fit on a "
+                f"{self.shape[0]}x{self.shape[1]} board")
+
+        fleet = self._sample(ships, 0, random_state)
+
+        if fleet is None:
+            raise ValueError(
+                f"Fleet {list(ships)} does not fit on a "
+                f"{self.shape[0]}x{self.shape[1]} board")
+
+        fleet.reverse()
+        return fleet
+
+    def _sample(self, ships, forbidden, random_state):
+
+        if not ships:
+            return []
+
+        legal = self.legal(ships[0], forbidden)
+
+        if not legal:
+            return None
+
+        start = random_state.randint(len(legal))
+
+        for offset in range(len(legal)):
+            pid = legal[(start + offset) % len(legal)]
+            fleet = self._sample(
+                ships[1:], forbidden | self.halos[pid], random_state)
+            if fleet is not None:
+                fleet.append(pid)
+                return fleet
+
+        return None
+
+    def sample_consistent(self, ships, blocked=0, hits=0, random_state=np.random):
+
+        # Draws one pid per ship for a non-touching fleet that avoids the
+        # blocked cells and covers every hit cell, or returns None if the
+        # draw ran into a dead end. Ships are first placed over the lowest
+        # uncovered hit, picked among all placements of the remaining
+        # lengths that cover it, then the rest go anywhere that is still
+        # legal, in fleet order. Dead ends aren't retried, callers draw
+        # again instead.
+
+        ships = [int(ship) for ship in ships]
+        fleet = []
+        forbidden = blocked
+        uncovered = hits
+
+        while uncovered:
+
+            cell = (uncovered & -uncovered).bit_length() - 1
+
+            options = [
+                pid for pid in self._by_cell[cell]
+                if self.lengths[pid] in ships
+                and not self.masks[pid] & forbidden
+                # Other hits next to it would be another ship touching it
+                and not self.halos[pid] & hits & ~self.masks[pid]
+                # and a ship on hits only would have been sunk
+                and self.masks[pid] & ~hits
+                ]
+
+            if not options:
+                return None
+
+            pid = options[random_state.randint(len(options))]
+            ships.remove(self.lengths[pid])
+            fleet.append(pid)
+            forbidden |= self.halos[pid]
+            uncovered &= ~self.masks[pid]
+
+        for length in ships:
+
+            legal = self.legal(length, forbidden)
+
+            if not legal:
+                return None
+
+            pid = legal[random_state.randint(len(legal))]
+            fleet.append(pid)
+            forbidden |= self.halos[pid]
+
+        return fleet
+
+    def consistent_layouts(self, ships, blocked=0, hits=0, limit=None):
+
+        # Every non-touching layout of the ships that avoids the blocked
+        # cells and covers every hit cell, as sorted tuples of pids. Like
+        # sample_consistent, the lowest uncovered hit is covered first, so
+        # each layout comes up once, and ships wholly on hits are left out,
+        # as they would have been sunk. Returns None as soon as more than
+        # limit layouts were found.
+
+        layouts = []
+
+        def cover(ships, forbidden, uncovered, fleet):
+
+            if not uncovered:
+                return fill(ships, forbidden, fleet, 0)
+
+            cell = (uncovered & -uncovered).bit_length() - 1
+
+            for pid in self._by_cell[cell]:
+                length = self.lengths[pid]
+                if length in ships \
+                        and not self.masks[pid] & forbidden \
+                        and not self.halos[pid] & hits & ~self.masks[pid] \
+                        and self.masks[pid] & ~hits:
+                    rest = list(ships)
+                    rest.remove(length)
+                    if not cover(
+                            rest, forbidden | self.halos[pid],
+                            uncovered & ~self.masks[pid], fleet + (pid,)):
+                        return False
+
+            return True
+
+        def fill(ships, forbidden, fleet, first):
+
+            # Ships of the same length go in increasing pid order, starting
+            # from first
+
+            if not ships:
+                layouts.append(tuple(sorted(fleet)))
+                return limit is None or len(layouts) <= limit
+
+            length = ships[0]
+            same = len(ships) > 1 and ships[1] == length
+
+            for pid in self.legal(length, forbidden):
+                if pid >= first and not fill(
+                        ships[1:], forbidden | self.halos[pid], fleet + (pid,),
+                        pid + 1 if same else 0):
+                    return False
+
+            return True
+
+        ships = sorted((int(ship) for ship in ships), reverse=True)
+
+        if not cover(ships, blocked, hits, ()):
+            return None
+
+        return layouts
+
+@functools.lru_cache(maxsize=None)
+def _placement_table(shape, lengths):
+    return PlacementTable(shape, lengths)
+
+def placement_table(shape=(10, 10), ships=(5, 4, 3, 3, 2)):
+    # Tables are immutable, so one is shared per board shape and set of lengths
+    return _placement_table(tuple(shape), tuple(sorted(set(ships))))
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import collections
+import csv
+import time
+
+# Phases the algorithms and analyzers time, in the order they run
+PHASES = ("mask", "sunk", "target", "hunt", "fallback")
+
+class PhaseProfiler:
+
+    # Call counts and cumulative nanoseconds per phase. Code being profiled
+    # takes time.perf_counter_ns() when a phase starts and passes it to
+    # record when the phase ends.
+
+    def __init__(self):
+        self.calls = collections.Counter()
+        self.nanoseconds = collections.Counter()
+
+    def record(self, phase, start):
+        self.calls[phase] += 1
+        self.nanoseconds[phase] += time.perf_counter_ns() - start
+
+    def merge(self, other):
+        self.calls.update(other.calls)
+        self.nanoseconds.update(other.nanoseconds)
+
+    def clear(self):
+        self.calls.clear()
+        self.nanoseconds.clear()
+
+    def summary(self):
+
+        total = sum(self.nanoseconds.values())
+        phases = [phase for phase in PHASES if phase in self.calls] \
+            + sorted(set(self.calls) - set(PHASES))
+
+        return {
+            phase: {
+                "calls": self.calls[phase],
+                "nanoseconds": self.nanoseconds[phase],
+                "ns_per_call": self.nanoseconds[phase] / self.calls[phase],
+                "share": self.nanoseconds[phase] / total if total else 0.0,
+                }
+            for phase in phases
+            }
+
+    def report(self):
+        lines = [f"{'phase':>10} {'calls':>10} {'ms':>10} {'ns/call':>10} {'share':>6}"]
+        for phase, row in self.summary().items():
+            lines.append(
+                f"{phase:>10} {row['calls']:>10} "
+                f"{row['nanoseconds'] / 1e6:>10.1f} "
+                f"{row['ns_per_call']:>10.0f} {row['share']:>6.1%}")
+        return "\n".join(lines)
+
+    def export(self, path):
+        with open(path, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(["phase", "calls", "nanoseconds", "ns_per_call", "share"])
+            for phase, row in self.summary().items():
+                writer.writerow([phase] + list(row.values()))
+
+# The profiler the algorithms record to, None while profiling is off so
+# that the only cost then is checking for None
+profiler = None
+
+def enable():
+    global profiler
+    if profiler is None:
+        profiler = PhaseProfiler()
+    return profiler
+
+def disable():
+    # Returns the profiler that was on, if any
+    global profiler
+    finished, profiler = profiler, None
+    return finished
@@ -0,0 +1,482 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import collections
+import glob
+import os
+import threading
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from tf_agents.trajectories import trajectory
+
+from board import UNKNOWN
+from encoding import INT32, PLANES, decode, encode
+
+# Priorities are raised to this power, 0 samples uniformly
+PRIORITY_EXPONENT = 0.6
+# How much importance weights correct for prioritized sampling, 1 fully
+IMPORTANCE_EXPONENT = 0.4
+# Keeps transitions with no TD error sampled now and then
+MIN_PRIORITY = 1e-3
+
+# Cells per byte of stored boards, 2 bits each
+CELLS_PER_BYTE = 4
+
+SampleInfo = collections.namedtuple("SampleInfo", ["ids", "weights"])
+
+def _pack(boards):
+    # (n, size) cell values to (n, size / 4) bytes
+    boards = np.asarray(boards, dtype=np.uint8)
+    padding = -boards.shape[1] % CELLS_PER_BYTE
+    if padding:
+        boards = np.pad(boards, ((0, 0), (0, padding)))
+    quads = boards.reshape(len(boards), -1, CELLS_PER_BYTE)
+    return quads[..., 0] | quads[..., 1] << 2 | quads[..., 2] << 4 \
+        | quads[..., 3] << 6
+
+def _unpack(packed, size):
+    shifts = np.arange(0, 2 * CELLS_PER_BYTE, 2, dtype=np.uint8)
+    cells = packed[..., None] >> shifts & 3
+    return cells.reshape(len(packed), -1)[:, :size]
+
+def _importance_weights(probabilities, size, exponent):
+    weights = (size * probabilities) ** -exponent
+    return (weights / weights.max()).astype(np.float32)
+
+class SumTree:
+
+    # Binary tree over capacity priorities, each node the sum of its two
+    # children, so the total is at the root and sampling proportionally to
+    # priority is one walk down per sample. Leaves start at capacity
+    # rounded up to a power of two. Updates and walks are vectorized over
+    # many leaves at a time.
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._leaves = 1 << max(capacity - 1, 0).bit_length()
+        self._tree = np.zeros(2 * self._leaves)
+
+    @property
+    def total(self):
+        return self._tree[1]
+
+    @property
+    def priorities(self):
+        return self._tree[self._leaves:self._leaves + self.capacity]
+
+    def update(self, indices, priorities):
+
+        nodes = np.asarray(indices) + self._leaves
+        self._tree[nodes] = priorities
+
+        nodes = np.unique(nodes // 2)
+        while nodes[0]:
+            self._tree[nodes] = self._tree[2 * nodes] + self._tree[2 * nodes + 1]
+            nodes = np.unique(nodes // 2)
+
+    def find(self, values):
+
+        # Leaf each value falls in, walking down with values in [0, total)
+
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+
+        while nodes[0] < self._leaves:
+            left = self._tree[2 * nodes]
+            right = values >= left
+            values -= np.where(right, left, 0)
+            nodes = 2 * nodes + right
+
+        # Rounding can step onto an empty leaf right after the last one
+        return np.minimum(nodes - self._leaves, self.capacity - 1)
+
+class ReplayStore:
+
+    # Replay buffer for the DQN agent, on NumPy arrays rather than TF
+    # variables. Every row holds one step of one of the batch_size envs,
+    # with the board packed 2 bits per cell and without legal actions,
+    # which are the cells still unknown. Rows of a step are added side by
+    # side, so the next step of row i is row i + batch_size, and sampling
+    # rebuilds 2-step trajectories like TFUniformReplayBuffer.as_dataset
+    # with num_steps=2 gives from the two rows. Row i is sampled with
+    # probability proportional to its priority (see SumTree), new rows
+    # getting the highest priority seen so far, until the learner passes
+    # their TD errors to update_priorities.
+    #
+    # With a directory, checkpoint writes the rows added since the last
+    # checkpoint as a new chunk file, plus the priorities, and restore
+    # rebuilds the store from them. A lock makes adding, sampling and
+    # updating safe from several threads.
+
+    def __init__(
+            self, data_spec, batch_size, capacity,
+            shape=(10, 10), encoding=INT32, directory=None,
+            priority_exponent=PRIORITY_EXPONENT,
+            importance_exponent=IMPORTANCE_EXPONENT, seed=None):
+
+        self.data_spec = data_spec
+        self.batch_size = batch_size
+        # Whole steps only, so rows keep their env's column
+        self.capacity = max(capacity // batch_size, 2) * batch_size
+        self.shape = tuple(shape)
+        self.encoding = encoding
+        self.directory = directory
+        self.priority_exponent = priority_exponent
+        self.importance_exponent = importance_exponent
+
+        self._size = self.shape[0] * self.shape[1]
+        self._masked = isinstance(data_spec.observation, dict)
+
+        capacity = self.capacity
+        self._boards = np.zeros(
+            (capacity, -(-self._size // CELLS_PER_BYTE)), dtype=np.uint8)
+        self._step_type = np.zeros(capacity, dtype=np.int8)
+        self._next_step_type = np.zeros(capacity, dtype=np.int8)
+        self._action = np.zeros(capacity, dtype=np.int32)
+        self._reward = np.zeros(capacity, dtype=np.float32)
+        self._discount = np.zeros(capacity, dtype=np.float32)
+
+        self._tree = SumTree(capacity)
+        self._max_priority = 1.0
+        self._random_state = np.random.RandomState(seed)
+
+        # Rows ever added, and rows up to which the chunks on disk go
+        self.rows_added = 0
+        self._checkpointed = 0
+
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return min(self.rows_added, self.capacity)
+
+    def _boards_of(self, observations):
+        # Cell values of encoded observations, flattened
+        observations = np.asarray(observations)
+        if self.encoding == PLANES:
+            planes = decode(observations, self.shape, PLANES)
+            return planes.argmax(axis=-1).reshape(len(observations), -1)
+        return observations.reshape(len(observations), -1)
+
+    def add(self, observations, step_type, next_step_type, action, reward,
+            discount):
+        # Adds one step of every env, observations encoded like the data spec
+        with self.lock:
+            self._add(
+                self._boards_of(observations), step_type, next_step_type,
+                action, reward, discount)
+
+    def _add(self, boards, step_type, next_step_type, action, reward, discount):
+
+        # Adds one step of every env, boards as flat cell values
+
+        start = self.rows_added % self.capacity
+        rows = np.arange(start, start + self.batch_size)
+
+        self._boards[rows] = _pack(boards)
+        self._step_type[rows] = step_type
+        self._next_step_type[rows] = next_step_type
+        self._action[rows] = action
+        self._reward[rows] = reward
+        self._discount[rows] = discount
+
+        # The new rows have no next step yet, and complete the previous ones
+        self._tree.update(rows, 0.0)
+        if self.rows_added:
+            self._tree.update(
+                (rows - self.batch_size) % self.capacity,
+                self._max_priority ** self.priority_exponent)
+
+        self.rows_added += self.batch_size
+
+    def add_batch(self, items):
+
+        # Observer for drivers, takes a batched Trajectory of tensors
+
+        observation = items.observation
+        if self._masked:
+            observation = observation['observation']
+
+        def add(*arrays):
+            self.add(*arrays)
+            return np.int64(self.rows_added)
+
+        return tf.numpy_function(
+            add,
+            [observation, items.step_type, items.next_step_type,
+             items.action, items.reward, items.discount],
+            tf.int64, name="replay_add")
+
+    @property
+    def total(self):
+        # Sum of the priorities
+        return self._tree.total
+
+    def sample(self, sample_batch_size):
+
+        # 2-step experience as NumPy arrays, flattened like tf.nest.flatten
+        # of the data spec, then the ids and importance weights
+
+        with self.lock:
+            ids, probabilities = self._draw(sample_batch_size)
+            experience = self._gather(ids)
+
+        weights = _importance_weights(
+            probabilities, len(self), self.importance_exponent)
+
+        return experience + [ids.astype(np.int64), weights]
+
+    def _draw(self, count):
+
+        # Ids of count rows drawn by priority, and their probabilities
+
+        total = self._tree.total
+        if not total:
+            raise ValueError("No complete transitions in the replay store")
+
+        # One sample per equal slice of the total, which spreads them out
+        bounds = np.arange(count) * (total / count)
+        ids = self._tree.find(
+            bounds + self._random_state.uniform(0, total / count, count))
+
+        return ids, self._tree.priorities[ids] / total
+
+    def _gather(self, ids):
+
+        # Experience of rows ids and the rows after them, flattened
+
+        rows = np.stack([ids, (ids + self.batch_size) % self.capacity], axis=1)
+
+        boards = _unpack(self._boards[rows.ravel()], self._size)
+        observation = encode(
+            boards.reshape((-1,) + self.shape), self.encoding).reshape(
+                rows.shape + self._encoded_shape)
+        if self._masked:
+            observation = {
+                'observation': observation,
+                'legal_actions': (boards == UNKNOWN).astype(np.uint8).reshape(
+                    rows.shape + (self._size,)),
+                }
+
+        experience = trajectory.Trajectory(
+            step_type=self._step_type[rows].astype(np.int32),
+            observation=observation,
+            action=self._action[rows],
+            policy_info=(),
+            next_step_type=self._next_step_type[rows].astype(np.int32),
+            reward=self._reward[rows],
+            discount=self._discount[rows])
+
+        return tf.nest.flatten(experience)
+
+    @property
+    def _encoded_shape(self):
+        spec = self.data_spec.observation
+        if self._masked:
+            spec = spec['observation']
+        return tuple(spec.shape)
+
+    def update_priorities(self, ids, td_errors):
+        priorities = np.abs(np.asarray(td_errors, dtype=np.float64)) \
+            + MIN_PRIORITY
+        with self.lock:
+            self._max_priority = max(self._max_priority, priorities.max())
+            # Rows overwritten since they were sampled are left alone
+            live = self._tree.priorities[ids] > 0
+            if live.any():
+                self._tree.update(
+                    ids[live], priorities[live] ** self.priority_exponent)
+        return np.int64(len(ids))
+
+    def as_dataset(self, sample_batch_size, prefetch=tf.data.AUTOTUNE):
+
+        # Endless dataset of (experience, SampleInfo), experience shaped
+        # [sample_batch_size, 2, ...] after the data spec. Sampling runs on
+        # the dataset's threads, prefetch batches ahead of the learner, or
+        # only when the learner asks for a batch with prefetch=0.
+
+        specs = tf.nest.flatten(self.data_spec)
+        dtypes = [spec.dtype for spec in specs] + [tf.int64, tf.float32]
+        shapes = [
+            [sample_batch_size, 2] + list(spec.shape) for spec in specs
+            ] + [[sample_batch_size], [sample_batch_size]]
+
+        def sample(_):
+            tensors = tf.numpy_function(
+                self.sample, [sample_batch_size], dtypes, name="replay_sample")
+            for tensor, shape in zip(tensors, shapes):
+                tensor.set_shape(shape)
+            experience = tf.nest.pack_sequence_as(
+                self.data_spec, tensors[:len(specs)])
+            return experience, SampleInfo(*tensors[len(specs):])
+
+        dataset = tf.data.Dataset.range(1).repeat().map(sample)
+        if not prefetch:
+            return dataset
+        return dataset.prefetch(prefetch)
+
+    def tf_update_priorities(self, ids, td_errors):
+        return tf.numpy_function(
+            self.update_priorities, [ids, td_errors], tf.int64,
+            name="replay_update_priorities")
+
+    def checkpoint(self):
+
+        # Writes the rows added since the last checkpoint, and deletes the
+        # chunks whose rows have all been overwritten since
+
+        if self.directory is None or self._checkpointed == self.rows_added:
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+
+        # Copied under the lock, written without it
+        with self.lock:
+            rows_added = self.rows_added
+            start = max(self._checkpointed, rows_added - self.capacity)
+            rows = np.arange(start, rows_added) % self.capacity
+            chunk = {
+                "boards": self._boards[rows],
+                "step_type": self._step_type[rows],
+                "next_step_type": self._next_step_type[rows],
+                "action": self._action[rows],
+                "reward": self._reward[rows],
+                "discount": self._discount[rows],
+                }
+            priorities = self._tree.priorities.astype(np.float32)
+            max_priority = self._max_priority
+
+        np.savez(
+            os.path.join(
+                self.directory, f"rows {start:015d}-{rows_added:015d}.npz"),
+            **chunk)
+
+        # Priorities change everywhere, so they're written whole, but they
+        # are a small part of the store
+        np.savez(
+            os.path.join(self.directory, "priorities.npz"),
+            priorities=priorities,
+            max_priority=max_priority,
+            rows_added=rows_added)
+
+        for path in self._chunks():
+            end = int(os.path.basename(path)[:-4].split("-")[1])
+            if end <= rows_added - self.capacity:
+                os.remove(path)
+
+        self._checkpointed = rows_added
+
+    def _chunks(self):
+        return sorted(glob.glob(os.path.join(self.directory, "rows *.npz")))
+
+    def restore(self):
+
+        # Loads the last checkpoint, if any. Returns whether there was one.
+
+        if self.directory is None or not os.path.exists(
+                os.path.join(self.directory, "priorities.npz")):
+            return False
+
+        with np.load(os.path.join(self.directory, "priorities.npz")) as saved:
+            rows_added = int(saved["rows_added"])
+            priorities = saved["priorities"]
+            self._max_priority = float(saved["max_priority"])
+
+        for path in self._chunks():
+            start, end = (
+                int(bound) for bound in
+                os.path.basename(path)[5:-4].split("-"))
+            # Chunks written after the priorities can't be trusted
+            if end > rows_added:
+                continue
+            rows = np.arange(start, end) % self.capacity
+            with np.load(path) as chunk:
+                self._boards[rows] = chunk["boards"]
+                self._step_type[rows] = chunk["step_type"]
+                self._next_step_type[rows] = chunk["next_step_type"]
+                self._action[rows] = chunk["action"]
+                self._reward[rows] = chunk["reward"]
+                self._discount[rows] = chunk["discount"]
+
+        self._tree.update(np.arange(self.capacity), priorities)
+        self.rows_added = self._checkpointed = rows_added
+
+        return True
+
+class ShardedReplay:
+
+    # ReplayStores sampled as one, each shard fed by its own writer (see
+    # actor_learner.py), so that writers never interleave their steps in
+    # a store. Shards are picked in proportion to their total priority,
+    # which samples rows with the same probabilities as one big store.
+    # Ids are shard index * SHARD_IDS + id within the shard.
+
+    SHARD_IDS = 1 << 40
+
+    def __init__(self, stores, seed=None):
+        self.stores = list(stores)
+        self.data_spec = self.stores[0].data_spec
+        self.importance_exponent = self.stores[0].importance_exponent
+        self._random_state = np.random.RandomState(seed)
+
+    def __len__(self):
+        return sum(len(store) for store in self.stores)
+
+    @property
+    def rows_added(self):
+        return sum(store.rows_added for store in self.stores)
+
+    @property
+    def total(self):
+        return sum(store.total for store in self.stores)
+
+    def sample(self, sample_batch_size):
+
+        # Waits for the writers while nothing is complete yet
+        totals = np.array([store.total for store in self.stores])
+        while not totals.sum():
+            time.sleep(0.01)
+            totals = np.array([store.total for store in self.stores])
+
+        counts = self._random_state.multinomial(
+            sample_batch_size, totals / totals.sum())
+
+        parts = []
+        ids = []
+        probabilities = []
+
+        for index, (store, count) in enumerate(zip(self.stores, counts)):
+            if not count:
+                continue
+            with store.lock:
+                shard_ids, shard_probabilities = store._draw(count)
+                parts.append(store._gather(shard_ids))
+            ids.append(shard_ids + index * self.SHARD_IDS)
+            probabilities.append(
+                shard_probabilities * totals[index] / totals.sum())
+
+        experience = [np.concatenate(arrays) for arrays in zip(*parts)]
+        weights = _importance_weights(
+            np.concatenate(probabilities), len(self), self.importance_exponent)
+
+        return experience + [np.concatenate(ids).astype(np.int64), weights]
+
+    def update_priorities(self, ids, td_errors):
+        shards = ids // self.SHARD_IDS
+        for index in np.unique(shards):
+            chosen = shards == index
+            self.stores[index].update_priorities(
+                ids[chosen] % self.SHARD_IDS, np.asarray(td_errors)[chosen])
+        return np.int64(len(ids))
+
+    as_dataset = ReplayStore.as_dataset
+    tf_update_priorities = ReplayStore.tf_update_priorities
+
+    def checkpoint(self):
+        for store in self.stores:
+            store.checkpoint()
+
+    def restore(self):
+        return all([store.restore() for store in self.stores])
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import csv
+import os
+import queue
+import threading
+
+import numpy as np
+
+# Saves waiting for the writer before submitting another one blocks
+MAX_PENDING_SAVES = 2
+
+class BackgroundWriter:
+
+    # Runs saves one after another on a thread of its own, so training
+    # doesn't wait on the disk. At most max_pending saves wait in the
+    # queue, after which submit blocks until the oldest one is done, so a
+    # slow disk slows training down instead of piling up snapshots in
+    # memory. An error in a save is raised by the next submit, flush or
+    # close.
+
+    def __init__(self, max_pending=MAX_PENDING_SAVES):
+
+        self._queue = queue.Queue(max_pending)
+        self._error = None
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+
+        while True:
+
+            job = self._queue.get()
+
+            if job is None:
+                self._queue.task_done()
+                return
+
+            function, args = job
+            try:
+                function(*args)
+            except Exception as error:
+                self._error = error
+            finally:
+                self._queue.task_done()
+
+    def _raise(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def submit(self, function, *args):
+        self._raise()
+        self._queue.put((function, args))
+
+    def flush(self):
+        # Waits for every submitted save
+        self._queue.join()
+        self._raise()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        self._raise()
+
+class StatsLog:
+
+    # Training statistics as append-only CSV files in directory, one per
+    # series, like "losses" with columns step and loss. Rows are kept in
+    # memory until take, and write appends them, so every save only costs
+    # the rows added since the last one.
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._columns = {}
+        self._rows = {}
+
+    def path(self, series):
+        return os.path.join(self.directory, series + ".csv")
+
+    def append(self, series, **values):
+        columns = self._columns.setdefault(series, list(values))
+        self._rows.setdefault(series, []).append(
+            [values[column] for column in columns])
+
+    def take(self):
+        # Rows since the last take, to pass to write
+        rows, self._rows = self._rows, {}
+        return {series: (self._columns[series], rows[series]) for series in rows}
+
+    def write(self, rows):
+
+        os.makedirs(self.directory, exist_ok=True)
+
+        for series, (columns, series_rows) in rows.items():
+            path = self.path(series)
+            new = not os.path.exists(path)
+            with open(path, "a", newline="") as file:
+                writer = csv.writer(file)
+                if new:
+                    writer.writerow(columns)
+                writer.writerows(series_rows)
+
+def read_stats(path):
+    # Columns of a StatsLog file, as float arrays by name
+    with open(path, newline="") as file:
+        reader = csv.reader(file)
+        columns = next(reader)
+        rows = np.array(list(reader), dtype=np.float64).reshape(-1, len(columns))
+    return {column: rows[:, index] for index, column in enumerate(columns)}
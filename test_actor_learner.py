@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import tensorflow as tf
+
+from tf_agents.environments import wrappers
+from tf_agents.networks import q_network
+
+from actor_learner import Actor, RateLimiter, WeightPublisher
+from board import UNKNOWN
+from env import PyBattleshipEnv
+from game import StepType
+
+class Rows:
+
+    # Stands in for a replay store: keeps what the actor adds, and stops
+    # it after rows rows
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.added = []
+        self.actor = None
+
+    def add(self, boards, step_type, next_step_type, action, reward,
+            discount):
+        self.added.append((boards[0], step_type[0], action[0]))
+        if len(self.added) == self.rows:
+            self.actor.stop()
+
+def splitter(observation):
+    return observation['observation'], observation['legal_actions']
+
+def test_stored_boards_are_from_before_the_shot():
+
+    env = wrappers.TimeLimit(
+        PyBattleshipEnv(observe_legal_actions=True), duration=100)
+    network = q_network.QNetwork(
+        tf.TensorSpec((10, 10), tf.int32), env.action_spec(),
+        preprocessing_layers=tf.keras.layers.Lambda(
+            lambda board: tf.cast(board, tf.float32)),
+        fc_layer_params=(16,))
+    network.create_variables()
+
+    store = Rows(300)
+    store.actor = Actor(
+        env, store, network, WeightPublisher(network),
+        RateLimiter(min_size=0, error_buffer=10 ** 9), 0.5,
+        observation_and_action_constraint_splitter=splitter)
+
+    # In this thread, until the store stops it
+    store.actor.run()
+
+    for (board, step_type, action), (next_board, next_step_type, _) in zip(
+            store.added, store.added[1:]):
+
+        # The action of a last step only restarts the game, and may be on
+        # a full board
+        if step_type == StepType.LAST:
+            continue
+
+        # Legal actions only, so the cell was not shot before this step
+        assert board.flat[action] == UNKNOWN
+        if next_step_type != StepType.FIRST:
+            assert next_board.flat[action] != UNKNOWN
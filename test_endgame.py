@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import functools
+import itertools
+
+import numpy as np
+import pytest
+
+from endgame import EndgameSolver
+from placement import placement_table
+
+def all_layouts(shape, ships):
+    # Every non-touching layout, as one cell set per ship
+    table = placement_table(shape, ships)
+    layouts = []
+    for fleet in itertools.product(*(table.placements(ship) for ship in ships)):
+        if all(not table.halos[pid] & table.masks[other]
+               for pid, other in itertools.combinations(fleet, 2)):
+            layouts.append(tuple(
+                frozenset(table.cells[pid].tolist()) for pid in fleet))
+    return layouts
+
+def result(layout, shots, cell):
+    # What shooting cell shows, after shots: a miss, a hit, or the cells
+    # of the ship it sinks
+    for ship in layout:
+        if cell in ship:
+            return ship if ship <= shots | {cell} else "hit"
+    return "miss"
+
+def brute_force(layouts, shots, size):
+
+    # Fewest expected shots to sink every ship, trying every cell not
+    # shot yet at every step, with the layouts equally likely. Cells no
+    # layout has a ship on are left out, they can only waste a shot.
+
+    @functools.lru_cache(maxsize=None)
+    def expected(layouts, shots):
+
+        if all(ship <= shots for ship in layouts[0]):
+            return 0.0
+
+        cells = set().union(*(ship for layout in layouts for ship in layout))
+
+        best = float("inf")
+        for cell in cells - shots:
+            outcomes = {}
+            for layout in layouts:
+                outcomes.setdefault(
+                    result(layout, shots, cell), []).append(layout)
+            best = min(best, 1 + sum(
+                len(group) / len(layouts)
+                * expected(tuple(group), shots | {cell})
+                for group in outcomes.values()))
+        return best
+
+    return expected(tuple(layouts), frozenset(shots))
+
+def position(shape, ships, layout, shots):
+    # Solver arguments for the board after shots on layout
+    table = placement_table(shape, ships)
+    misses = hits = sunk = blocked = 0
+    remaining = list(ships)
+    for cell in shots:
+        if not any(cell in ship for ship in layout):
+            misses |= 1 << cell
+            blocked |= 1 << cell
+    for ship in layout:
+        bits = sum(1 << cell for cell in ship)
+        if ship <= shots:
+            sunk |= bits
+            remaining.remove(len(ship))
+            pid = next(pid for pid in table.placements(len(ship))
+                       if table.masks[pid] == bits)
+            blocked |= table.halos[pid]
+        else:
+            hits |= sum(1 << cell for cell in ship & shots)
+    return misses, hits, sunk, remaining, blocked
+
+def board(layout, shots):
+    # What the board shows after shots
+    return {
+        cell: result(layout, shots - {cell}, cell) != "miss"
+        and ("sunk" if any(cell in ship and ship <= shots for ship in layout)
+             else "hit")
+        for cell in shots}
+
+def consistent(layouts, layout, shots):
+    return [other for other in layouts
+            if board(other, shots) == board(layout, shots)]
+
+@pytest.mark.parametrize("shape, ships", [
+    ((3, 3), (2,)),
+    ((3, 4), (2, 1)),
+    ((2, 6), (3, 1)),
+    ])
+def test_opening_is_optimal_on_small_boards(shape, ships):
+
+    layouts = all_layouts(shape, ships)
+    solver = EndgameSolver(
+        ships, shape, max_layouts=len(layouts), max_nodes=10 ** 7)
+
+    solved = solver.solve(0, 0, 0, ships, 0)
+    size = shape[0] * shape[1]
+
+    assert solved[0] == pytest.approx(brute_force(layouts, set(), size))
+
+    # Its cell is one of the best first shots
+    shots = {solved[1]}
+    outcomes = {}
+    for layout in layouts:
+        outcomes.setdefault(result(layout, set(), solved[1]), []).append(layout)
+    assert solved[0] == pytest.approx(1 + sum(
+        len(group) / len(layouts) * brute_force(group, shots, size)
+        for group in outcomes.values()))
+
+def test_positions_during_games_are_solved_optimally():
+
+    shape, ships = (4, 5), (3, 2)
+    size = shape[0] * shape[1]
+    layouts = all_layouts(shape, ships)
+    random_state = np.random.RandomState(0)
+
+    solver = EndgameSolver(ships, shape, max_layouts=12, max_nodes=10 ** 7)
+    solved_positions = 0
+
+    for _ in range(30):
+
+        layout = layouts[random_state.randint(len(layouts))]
+        shots = set()
+
+        for cell in random_state.permutation(size)[:size // 2].tolist():
+
+            shots.add(cell)
+            if all(ship <= shots for ship in layout):
+                break
+
+            solved = solver.solve(*position(shape, ships, layout, shots))
+            if solved is None:
+                continue
+
+            solved_positions += 1
+            assert solved[0] == pytest.approx(brute_force(
+                consistent(layouts, layout, shots), shots, size))
+
+    assert solved_positions > 20
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import collections
+
+import numpy as np
+
+from eval_service import FixedBoards, game_options, play
+from game import BoundedSpec
+from tournament import _layouts
+
+PolicyStep = collections.namedtuple("PolicyStep", ["action"])
+Specs = collections.namedtuple("Specs", ["observation"])
+
+class FirstLegalPolicy:
+
+    # Stands in for a saved policy: shoots the first cell not shot yet
+
+    time_step_spec = Specs({
+        'observation': BoundedSpec((10, 10), np.int32, 0, 3, 'observation'),
+        'legal_actions': BoundedSpec((100,), np.uint8, 0, 1, 'legal_actions'),
+        })
+
+    def action(self, time_step):
+        return PolicyStep(
+            np.argmax(time_step.observation['legal_actions'], axis=1))
+
+def layouts(boards):
+    return [list(boards.next()[1]) for _ in range(len(boards))]
+
+def test_boards_are_the_same_for_a_seed():
+    assert layouts(FixedBoards(300, seed=4)) == layouts(FixedBoards(300, seed=4))
+    assert layouts(FixedBoards(300, seed=4)) != layouts(FixedBoards(300, seed=5))
+
+def test_boards_are_the_tournaments_for_the_same_seed():
+    expected = _layouts((10, 10), (5, 4, 3, 3, 2), 2, 0, 250) \
+        + _layouts((10, 10), (5, 4, 3, 3, 2), 2, 1, 50)
+    assert layouts(FixedBoards(300, seed=2)) \
+        == [list(layout) for layout in expected]
+
+def test_next_cycles_and_reset_starts_over():
+
+    boards = FixedBoards(3)
+    assert [boards.next()[0] for _ in range(5)] == [0, 1, 2, 0, 1]
+
+    boards.reset()
+    assert boards.next()[0] == 0
+
+def test_every_play_puts_the_same_board_in_every_slot():
+
+    boards = FixedBoards(40)
+
+    first = play(FirstLegalPolicy(), boards)
+    second = play(FirstLegalPolicy(), boards)
+
+    np.testing.assert_array_equal(first[0], np.arange(40))
+    for first_result, second_result in zip(first[:3], second[:3]):
+        np.testing.assert_array_equal(first_result, second_result)
+
+    shots, finished = first[1], first[2]
+    assert finished.all()
+    assert (shots >= 17).all() and (shots <= 100).all()
+
+def test_game_options_follow_the_observation_spec():
+
+    assert game_options(FirstLegalPolicy()) == {
+        "observe_legal_actions": True, "observation_encoding": "int32"}
+
+    class Planes:
+        time_step_spec = Specs(BoundedSpec((50,), np.uint8, 0, 255, 'o'))
+
+    assert game_options(Planes()) == {
+        "observe_legal_actions": False, "observation_encoding": "planes"}
@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+
+from board import UNKNOWN, MISS, HIT, SUNK
+from game import BatchedBattleshipGame, BattleshipGame, StepType
+from placement import placement_table
+
+FLEET = (5, 4, 3, 3, 2)
+
+class Bank:
+
+    # Board bank of the given layouts, handed out in order
+
+    def __init__(self, layouts, shape=(10, 10), ships=FLEET):
+        self.shape = shape
+        self.ships = ships
+        self.placements = placement_table(shape, ships)
+        self._layouts = list(layouts)
+        self._index = 0
+
+    def next(self):
+        index = self._index
+        self._index = (index + 1) % len(self._layouts)
+        return index, self._layouts[index]
+
+def layouts(count, seed=0):
+    placements = placement_table((10, 10), FLEET)
+    random_state = np.random.RandomState(seed)
+    return [placements.sample(FLEET, random_state) for _ in range(count)]
+
+def ship_cells(layout):
+    placements = placement_table((10, 10), FLEET)
+    return [placements.cells[pid].tolist() for pid in layout]
+
+def water(layout):
+    return sorted(set(range(100)) - {
+        cell for cells in ship_cells(layout) for cell in cells})
+
+def game(layout, **kwargs):
+    return BattleshipGame(
+        list(FLEET), board_bank=Bank([layout]), observe_legal_actions=True,
+        **kwargs)
+
+def test_hits_sink_ships_and_the_last_one_wins():
+
+    layout = layouts(1)[0]
+    battleship = game(layout)
+    time_step = battleship.reset()
+    assert time_step.step_type == StepType.FIRST
+
+    ships = ship_cells(layout)
+    for ship, cells in enumerate(ships):
+        for index, cell in enumerate(cells):
+
+            time_step = battleship.step(cell)
+            board = time_step.observation['observation'].reshape(-1)
+
+            assert time_step.reward == 1
+            assert time_step.observation['legal_actions'][cell] == 0
+            if index < len(cells) - 1:
+                assert board[cell] == HIT
+            else:
+                assert (board[cells] == SUNK).all()
+
+            if ship < len(ships) - 1:
+                assert time_step.step_type == StepType.MID
+                assert time_step.discount == 1
+
+    assert time_step.step_type == StepType.LAST
+    assert time_step.discount == 0
+
+def test_misses_get_no_reward():
+
+    layout = layouts(1)[0]
+    battleship = game(layout)
+    battleship.reset()
+
+    cell = water(layout)[0]
+    time_step = battleship.step(cell)
+
+    assert time_step.step_type == StepType.MID
+    assert time_step.reward == 0
+    assert time_step.observation['observation'].reshape(-1)[cell] == MISS
+
+@pytest.mark.parametrize("options, reward", [
+    ({}, 0),
+    ({"punish_invalid_actions": True}, -1),
+    ({"punish_invalid_actions": True, "skip_invalid_actions": True}, -1),
+    ])
+def test_shooting_a_cell_again_changes_nothing(options, reward):
+
+    layout = layouts(1)[0]
+    battleship = game(layout, **options)
+    battleship.reset()
+
+    cell = water(layout)[0]
+    battleship.step(cell)
+    before = battleship.board.observation.copy()
+
+    time_step = battleship.step(cell)
+
+    assert time_step.step_type == StepType.MID
+    assert time_step.reward == reward
+    np.testing.assert_array_equal(
+        time_step.observation['observation'], before)
+    assert time_step.observation['legal_actions'].sum() == 99
+
+def test_skipping_shoots_the_next_free_cell_down_the_column():
+
+    battleship = game(layouts(1)[0], skip_invalid_actions=True)
+    battleship.reset()
+
+    battleship.step(90)
+    battleship.step(0)
+    battleship.step(0)
+    time_step = battleship.step(90)
+
+    # Below 0 is 10, after the bottom of the first column the top of the
+    # second one
+    legal_actions = time_step.observation['legal_actions']
+    assert list(np.flatnonzero(legal_actions == 0)) == [0, 1, 10, 90]
+
+def test_a_step_after_the_last_one_starts_a_new_game():
+
+    bank = layouts(2)
+    battleship = BattleshipGame(list(FLEET), board_bank=Bank(bank))
+    battleship.reset()
+    index = battleship.board_index
+
+    for cells in ship_cells(bank[index]):
+        for cell in cells:
+            time_step = battleship.step(cell)
+    assert time_step.step_type == StepType.LAST
+
+    time_step = battleship.step(0)
+
+    assert time_step.step_type == StepType.FIRST
+    assert (time_step.observation == UNKNOWN).all()
+    assert battleship.board_index == 1 - index
+
+def test_duration_truncates_without_ending_the_discount():
+
+    layout = layouts(1)[0]
+    battleship = BatchedBattleshipGame(
+        2, list(FLEET), board_bank=Bank([layout]), duration=3)
+    battleship.reset()
+
+    for cell in water(layout)[:2]:
+        time_step = battleship.step([cell, cell])
+        assert (time_step.step_type == StepType.MID).all()
+
+    time_step = battleship.step([water(layout)[2]] * 2)
+    assert (time_step.step_type == StepType.LAST).all()
+    assert (time_step.discount == 1).all()
+
+    time_step = battleship.step([0, 0])
+    assert (time_step.step_type == StepType.FIRST).all()
+    assert (time_step.observation == UNKNOWN).all()
+
+@pytest.mark.parametrize("options", [
+    {},
+    {"skip_invalid_actions": True},
+    {"punish_invalid_actions": True},
+    ])
+def test_batched_games_play_like_single_ones(options):
+
+    # Random shots, repeats included, over several episodes of each board
+    boards = 4
+    random_state = np.random.RandomState(0)
+
+    for layout in layouts(3):
+
+        singles = [game(layout, **options) for _ in range(boards)]
+        batched = BatchedBattleshipGame(
+            boards, list(FLEET), board_bank=Bank([layout]),
+            observe_legal_actions=True, **options)
+
+        single_steps = [single.reset() for single in singles]
+        batched_step = batched.reset()
+        ended = 0
+
+        for _ in range(600):
+
+            for board, single_step in enumerate(single_steps):
+                assert batched_step.step_type[board] == single_step.step_type
+                assert batched_step.reward[board] == single_step.reward
+                assert batched_step.discount[board] == single_step.discount
+                for key in ('observation', 'legal_actions'):
+                    np.testing.assert_array_equal(
+                        batched_step.observation[key][board],
+                        single_step.observation[key])
+
+            ended += (batched_step.step_type == StepType.LAST).sum()
+
+            actions = random_state.randint(0, 100, boards)
+            single_steps = [
+                single.step(action)
+                for single, action in zip(singles, actions)]
+            batched_step = batched.step(actions)
+
+        assert ended
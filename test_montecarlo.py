@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+from algorithms import Alg1, MonteCarlo, _sample_placements
+from analysis import BoardAnalyzer, to_bits
+from board import MISS, HIT, SUNK
+from game import BattleshipGame, StepType
+from placement import placement_table
+
+FLEET = (5, 4, 3, 3, 2)
+
+def positions(games, seed=0):
+
+    # (observation, analyzer) of every position with open hits in games
+    # Alg1 plays
+
+    np.random.seed(seed)
+    game = BattleshipGame(list(FLEET))
+    bot = Alg1(list(FLEET))
+    analyzer = BoardAnalyzer(list(FLEET))
+
+    for _ in range(games):
+
+        time_step = game.reset()
+        analyzer.reset()
+
+        while time_step.step_type != StepType.LAST:
+            analyzer.update(time_step.observation)
+            if analyzer.hits.any():
+                yield time_step.observation.copy(), analyzer
+            time_step = game.step(bot.action(time_step))
+
+        bot.action(time_step)
+
+def sampler_args(analyzer):
+    # Same position arguments as MonteCarlo gives _sample_placements
+    return (
+        tuple(analyzer.remaining),
+        to_bits(analyzer.mask & ~analyzer.hits),
+        to_bits(analyzer.hits))
+
+def test_sampled_fleets_agree_with_the_board():
+
+    table = placement_table((10, 10), FLEET)
+    random_state = np.random.RandomState(0)
+    sampled = 0
+
+    for observation, analyzer in positions(10):
+
+        remaining, blocked, hits = sampler_args(analyzer)
+        cells = observation.reshape(-1)
+
+        for _ in range(5):
+
+            fleet = table.sample_consistent(
+                remaining, blocked, hits, random_state)
+            if fleet is None:
+                continue
+            sampled += 1
+
+            assert sorted(table.lengths[pid] for pid in fleet) \
+                == sorted(remaining)
+
+            ships = np.zeros(100, dtype=int)
+            for pid in fleet:
+                assert not ships[table.cells[pid]].any()
+                ships[table.cells[pid]] = 1
+                # A ship on hits only would have been sunk
+                assert (cells[table.cells[pid]] != HIT).any()
+
+            # Misses and sunk ships are water to the ships afloat, and
+            # every open hit is on one of them
+            assert not ships[(cells == MISS) | (cells == SUNK)].any()
+            assert ships[cells == HIT].all()
+
+    assert sampled > 100
+
+def test_placement_counts_cover_every_hit_once_per_layout():
+
+    for observation, analyzer in positions(3):
+
+        remaining, blocked, hits = sampler_args(analyzer)
+        counts, accepted = _sample_placements(
+            ((10, 10), FLEET, remaining, blocked, hits, 50, None, 0))
+        table = placement_table((10, 10), FLEET)
+
+        for cell in np.flatnonzero(observation.reshape(-1) == HIT).tolist():
+            covering = [
+                pid for pid in range(len(table)) if table.masks[pid] >> cell & 1]
+            assert counts[covering].sum() == accepted
+
+        assert not counts[[
+            pid for pid in range(len(table))
+            if table.masks[pid] & blocked]].any()
+
+def test_never_shoots_a_cell_twice():
+
+    algorithm = MonteCarlo(list(FLEET), samples=20, seed=0)
+    np.random.seed(1)
+    game = BattleshipGame(list(FLEET), punish_invalid_actions=True)
+
+    for _ in range(3):
+        time_step = game.reset()
+        while time_step.step_type != StepType.LAST:
+            time_step = game.step(algorithm.action(time_step))
+            assert time_step.reward >= 0
+        algorithm.action(time_step)
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+
+from placement import HORIZONTAL, VERTICAL, PlacementTable, placement_table
+
+FLEET = (5, 4, 3, 3, 2)
+
+def test_counts_every_placement_once():
+    table = PlacementTable((10, 10), FLEET)
+    # 2 directions, 10 lines each, 11 - length positions per line
+    assert len(table) == sum(2 * 10 * (11 - length) for length in {5, 4, 3, 2})
+    assert len(set(zip(table.origins, table.directions, table.lengths))) \
+        == len(table)
+
+def test_single_cells_are_listed_once():
+    table = PlacementTable((3, 4), (1,))
+    assert len(table) == 12
+    assert set(table.directions) == {HORIZONTAL}
+
+def test_cells_masks_and_halos_agree():
+
+    table = PlacementTable((6, 7), (4, 2))
+    rows, cols = table.shape
+
+    for pid in range(len(table)):
+
+        row, col = table.origins[pid]
+        step = cols if table.directions[pid] == VERTICAL else 1
+        cells = row * cols + col + np.arange(table.lengths[pid]) * step
+
+        assert list(table.cells[pid]) == list(cells)
+        assert table.masks[pid] == sum(1 << int(cell) for cell in cells)
+        assert table.halos[pid] & table.masks[pid] == table.masks[pid]
+        assert np.all(cells < rows * cols)
+        assert table.cell_matrix[pid].sum() == table.lengths[pid]
+
+        ship_rows, ship_cols = table.coords[pid]
+        assert list(ship_rows * cols + ship_cols) == list(cells)
+
+def test_sample_places_a_non_touching_fleet_in_fleet_order():
+
+    table = placement_table((10, 10), FLEET)
+    random_state = np.random.RandomState(0)
+
+    for _ in range(200):
+
+        fleet = table.sample(FLEET, random_state)
+
+        assert [table.lengths[pid] for pid in fleet] == list(FLEET)
+        for index, pid in enumerate(fleet):
+            for other in fleet[index + 1:]:
+                assert not table.masks[other] & table.halos[pid]
+
+def test_sample_is_reproducible_with_a_seed():
+    table = placement_table((10, 10), FLEET)
+    first = [table.sample(FLEET, np.random.RandomState(3)) for _ in range(5)]
+    second = [table.sample(FLEET, np.random.RandomState(3)) for _ in range(5)]
+    assert first == second
+
+def test_sample_rejects_a_fleet_that_does_not_fit():
+    table = placement_table((3, 3), (3, 3, 3))
+    with pytest.raises(ValueError):
+        table.sample((3, 3, 3), np.random.RandomState(0))
+
+def test_sample_consistent_covers_hits_and_avoids_blocked_cells():
+
+    table = placement_table((10, 10), FLEET)
+    random_state = np.random.RandomState(1)
+
+    # The hits are open, so the ship on them goes on to the right
+    hits = 1 << 44 | 1 << 45
+    blocked = sum(1 << cell for cell in (0, 1, 2, 10, 20, 43))
+
+    fleets = [
+        table.sample_consistent(FLEET, blocked, hits, random_state)
+        for _ in range(100)]
+    fleets = [fleet for fleet in fleets if fleet is not None]
+    assert fleets
+
+    for fleet in fleets:
+
+        covered = 0
+        for pid in fleet:
+            assert not table.masks[pid] & blocked
+            covered |= table.masks[pid]
+        assert covered & hits == hits
+        assert covered >> 46 & 1
+        assert sorted(table.lengths[pid] for pid in fleet) == sorted(FLEET)
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import tensorflow as tf
+
+from tf_agents.trajectories import trajectory
+
+from board import UNKNOWN
+from encoding import PLANES, encode, encoded_dtype, encoded_shape
+from replay import ReplayStore, ShardedReplay, SumTree, _pack, _unpack
+
+SHAPE = (3, 3)
+SIZE = SHAPE[0] * SHAPE[1]
+
+def data_spec(encoding="int32", masked=False):
+    observation = tf.TensorSpec(
+        encoded_shape(SHAPE, encoding), tf.as_dtype(encoded_dtype(encoding)))
+    if masked:
+        observation = {
+            'observation': observation,
+            'legal_actions': tf.TensorSpec((SIZE,), tf.uint8),
+            }
+    return trajectory.Trajectory(
+        step_type=tf.TensorSpec((), tf.int32),
+        observation=observation,
+        action=tf.TensorSpec((), tf.int32),
+        policy_info=(),
+        next_step_type=tf.TensorSpec((), tf.int32),
+        reward=tf.TensorSpec((), tf.float32),
+        discount=tf.TensorSpec((), tf.float32))
+
+def boards_for(step, batch_size):
+    # A different board for every step and env
+    cells = (np.arange(batch_size * SIZE) + 7 * step) % 4
+    return cells.reshape((batch_size,) + SHAPE).astype(np.int32)
+
+def fill(store, steps, first=0, encoding="int32"):
+    batch_size = store.batch_size
+    for step in range(first, first + steps):
+        store.add(
+            encode(boards_for(step, batch_size), encoding),
+            np.ones(batch_size), np.ones(batch_size),
+            step * batch_size + np.arange(batch_size),
+            np.full(batch_size, step), np.ones(batch_size))
+
+def unflatten(store, sampled):
+    experience = tf.nest.pack_sequence_as(
+        store.data_spec, sampled[:-2])
+    return experience, sampled[-2], sampled[-1]
+
+def test_pack_round_trips_boards_of_any_size():
+    boards = np.random.RandomState(0).randint(0, 4, (5, 11))
+    assert (_unpack(_pack(boards), 11) == boards).all()
+
+def test_sum_tree_samples_in_proportion_to_priorities():
+
+    tree = SumTree(5)
+    priorities = np.array([1.0, 0.0, 3.0, 2.0, 4.0])
+    tree.update(np.arange(5), priorities)
+
+    assert tree.total == priorities.sum()
+
+    values = np.random.RandomState(0).uniform(0, tree.total, 100_000)
+    counts = np.bincount(tree.find(values), minlength=5)
+
+    assert counts[1] == 0
+    np.testing.assert_allclose(
+        counts / counts.sum(), priorities / priorities.sum(), atol=0.01)
+
+def test_samples_two_step_trajectories_of_one_env():
+
+    store = ReplayStore(data_spec(), 2, 40, shape=SHAPE, seed=0)
+    fill(store, 10)
+
+    experience, ids, weights = unflatten(store, store.sample(64))
+
+    # The second step is the same env's next step
+    np.testing.assert_array_equal(
+        experience.action[:, 1], experience.action[:, 0] + 2)
+    np.testing.assert_array_equal(experience.action[:, 0], ids)
+
+    for row, observation in zip(ids, experience.observation):
+        step, env = divmod(int(row), 2)
+        np.testing.assert_array_equal(
+            observation[0], boards_for(step, 2)[env])
+        np.testing.assert_array_equal(
+            observation[1], boards_for(step + 1, 2)[env])
+
+    assert weights.max() == 1
+
+def test_never_samples_rows_without_a_next_step():
+    store = ReplayStore(data_spec(), 2, 40, shape=SHAPE, seed=0)
+    fill(store, 5)
+    _, ids, _ = unflatten(store, store.sample(1000))
+    assert ids.max() < 8
+
+def test_sampling_follows_updated_priorities():
+
+    store = ReplayStore(data_spec(), 1, 20, shape=SHAPE, seed=0)
+    fill(store, 11)
+
+    store.update_priorities(np.arange(10), np.r_[100.0, np.zeros(9)])
+    _, ids, weights = unflatten(store, store.sample(1000))
+
+    assert (ids == 0).mean() > 0.8
+    # The rarely sampled rows get the largest weights
+    assert weights[ids == 0].max() < weights[ids != 0].min()
+
+def test_masked_observations_get_the_unknown_cells_as_legal_actions():
+
+    store = ReplayStore(
+        data_spec(PLANES, masked=True), 1, 20, shape=SHAPE,
+        encoding=PLANES, seed=0)
+    fill(store, 4, encoding=PLANES)
+
+    experience, ids, _ = unflatten(store, store.sample(16))
+
+    for row, legal_actions in zip(ids, experience.observation['legal_actions']):
+        board = boards_for(int(row), 1)[0]
+        np.testing.assert_array_equal(
+            legal_actions[0], (board == UNKNOWN).reshape(-1))
+
+def test_checkpoint_and_restore_round_trip(tmp_path):
+
+    store = ReplayStore(
+        data_spec(), 2, 12, shape=SHAPE, directory=str(tmp_path), seed=0)
+
+    # More rows than fit, over several chunks, so some get dropped
+    for first in range(0, 12, 3):
+        fill(store, 3, first)
+        store.update_priorities(
+            np.arange(4), np.arange(4, dtype=np.float64) + first)
+        store.checkpoint()
+
+    restored = ReplayStore(
+        data_spec(), 2, 12, shape=SHAPE, directory=str(tmp_path), seed=0)
+    assert restored.restore()
+
+    assert restored.rows_added == store.rows_added
+    np.testing.assert_allclose(
+        restored._tree.priorities, store._tree.priorities, rtol=1e-6)
+    for name in ("_boards", "_step_type", "_next_step_type", "_action",
+                 "_reward", "_discount"):
+        np.testing.assert_array_equal(
+            getattr(restored, name), getattr(store, name))
+
+    # 24 rows in chunks of 6, only the last 12 rows are still in the store
+    assert len(list(tmp_path.glob("rows *.npz"))) == 2
+
+def test_restore_without_a_checkpoint(tmp_path):
+    store = ReplayStore(
+        data_spec(), 2, 12, shape=SHAPE, directory=str(tmp_path))
+    assert not store.restore()
+    assert len(store) == 0
+
+def test_sharded_ids_point_into_their_shard():
+
+    stores = [
+        ReplayStore(data_spec(), 1, 20, shape=SHAPE, seed=shard)
+        for shard in range(2)]
+    fill(stores[0], 5)
+    fill(stores[1], 5, first=100)
+
+    replay = ShardedReplay(stores, seed=0)
+    experience, ids, _ = unflatten(replay, replay.sample(200))
+
+    shards, rows = np.divmod(ids, ShardedReplay.SHARD_IDS)
+    assert set(shards) == {0, 1}
+    np.testing.assert_array_equal(
+        experience.action[:, 0], rows + 100 * shards)
+
+    replay.update_priorities(ids[:1], np.array([5.0]))
+    assert stores[shards[0]]._tree.priorities[rows[0]] > 1
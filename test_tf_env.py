@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+import tensorflow as tf
+
+from game import BatchedBattleshipGame, StepType
+from test_game import FLEET, Bank, game, layouts, ship_cells
+from tf_env import TFBattleshipEnv
+
+BOARDS = 4
+
+def place(env, layout, boards):
+    # Puts layout on the boards where the mask is set, in place of the
+    # fleets the env drew for them
+    ship_ids = np.zeros(100, dtype=np.int32)
+    for ship, cells in enumerate(ship_cells(layout)):
+        ship_ids[cells] = ship + 1
+    env._ship_ids.assign(
+        tf.where(boards[:, None], ship_ids[None], env._ship_ids))
+
+def play(env, layout, actions):
+
+    # Time steps of the env on layout, as NumPy, for every row of actions
+
+    time_step = env.reset()
+    place(env, layout, np.ones(BOARDS, dtype=bool))
+
+    time_steps = [tf.nest.map_structure(np.asarray, time_step)]
+    for action in actions:
+        time_step = tf.nest.map_structure(np.asarray, env.step(action))
+        # Restarted boards drew a new fleet
+        place(env, layout, time_step.step_type == StepType.FIRST)
+        time_steps.append(time_step)
+
+    return time_steps
+
+def assert_same(time_step, expected, board=None):
+    # Compares the whole batch, or one board of it to a single game's
+    for name in ('step_type', 'reward', 'discount'):
+        value = getattr(time_step, name)
+        np.testing.assert_array_equal(
+            value if board is None else value[board],
+            getattr(expected, name))
+    for key in ('observation', 'legal_actions'):
+        value = time_step.observation[key]
+        np.testing.assert_array_equal(
+            value if board is None else value[board],
+            expected.observation[key])
+
+@pytest.mark.parametrize("options", [
+    {},
+    {"skip_invalid_actions": True},
+    {"punish_invalid_actions": True},
+    ])
+def test_plays_like_the_game(options):
+
+    layout = layouts(1, seed=1)[0]
+    actions = np.random.RandomState(0).randint(0, 100, (1000, BOARDS))
+
+    env = TFBattleshipEnv(
+        BOARDS, list(FLEET), observe_legal_actions=True, seed=0, **options)
+    time_steps = play(env, layout, actions)
+
+    singles = [game(layout, **options) for _ in range(BOARDS)]
+    for board, single in enumerate(singles):
+        assert_same(time_steps[0], single.reset(), board)
+        for action, time_step in zip(actions[:, board], time_steps[1:]):
+            assert_same(time_step, single.step(action), board)
+
+    # Every board played more than one episode
+    ends = sum(time_step.step_type == StepType.LAST for time_step in time_steps)
+    assert (ends > 1).all()
+
+def test_truncates_like_the_batched_game():
+
+    layout = layouts(1, seed=2)[0]
+    actions = np.random.RandomState(1).randint(0, 100, (60, BOARDS))
+
+    env = TFBattleshipEnv(
+        BOARDS, list(FLEET), duration=7, observe_legal_actions=True, seed=0)
+    time_steps = play(env, layout, actions)
+
+    batched = BatchedBattleshipGame(
+        BOARDS, list(FLEET), board_bank=Bank([layout]), duration=7,
+        observe_legal_actions=True)
+    assert_same(time_steps[0], batched.reset())
+    for action, time_step in zip(actions, time_steps[1:]):
+        assert_same(time_step, batched.step(action))
+
+    # Some boards were cut off before they were won
+    truncated = [
+        (time_step.step_type == StepType.LAST) & (time_step.discount == 1)
+        for time_step in time_steps]
+    assert np.any(truncated)
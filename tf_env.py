@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import tensorflow as tf
+
+from tf_agents.environments import tf_environment
+from tf_agents.specs import tensor_spec
+from tf_agents.trajectories import time_step as ts
+from tf_agents.utils import common
+
+from board import UNKNOWN, MISS, HIT, SUNK
+from encoding import (
+    INT32, encoded_dtype, encoded_maximum, encoded_shape, tf_encode)
+from placement import placement_table
+
+# Fleets that hit a dead end while being placed are drawn again, at most
+# this many times per reset
+MAX_PLACEMENT_ATTEMPTS = 100
+
+class TFBattleshipEnv(tf_environment.TFEnvironment):
+
+    # Same rules as PyBattleshipEnv, written as TF ops on a batch of boards
+    # held in variables, so collection never leaves the graph. Boards
+    # restart on their own on the step after their episode ends, like the
+    # Python envs do.
+
+    def __init__(
+            self, batch_size = 1, ships = None,
+            skip_invalid_actions = False,
+            punish_invalid_actions = False,
+            shape = (10, 10),
+            duration = None,
+            seed = None,
+            observe_legal_actions = False,
+            observation_encoding = INT32):
+
+        if ships is None:
+            ships = [5, 4, 3, 3, 2]
+
+        self._shape = rows, cols = tuple(shape)
+        self._size = rows * cols
+        self._ships = [int(ship) for ship in ships]
+
+        self._skip_invalid_actions = skip_invalid_actions
+        self._punish_invalid_actions = punish_invalid_actions
+        # Ends episodes after this many steps, like wrappers.TimeLimit
+        self._duration = duration
+
+        action_spec = tensor_spec.BoundedTensorSpec(
+            shape=(), dtype=tf.int32, minimum=0, maximum=self._size - 1,
+            name='action')
+
+        # See encoding.py
+        self._encoding = observation_encoding
+
+        observation_spec = tensor_spec.BoundedTensorSpec(
+            shape=encoded_shape(self._shape, observation_encoding),
+            dtype=encoded_dtype(observation_encoding),
+            minimum=0, maximum=encoded_maximum(observation_encoding),
+            name='observation')
+
+        self._observe_legal_actions = observe_legal_actions
+        if observe_legal_actions:
+            observation_spec = {
+                'observation': observation_spec,
+                'legal_actions': tensor_spec.BoundedTensorSpec(
+                    shape=(self._size,), dtype=tf.uint8, minimum=0,
+                    maximum=1, name='legal_actions')
+                }
+
+        super().__init__(
+            ts.time_step_spec(observation_spec), action_spec, batch_size)
+
+        # Cells and no-touch halos of every placement, one pair of
+        # (placements, size) matrices per ship length
+        placements = placement_table(self._shape, self._ships)
+        self._placement_cells = {}
+        self._placement_halos = {}
+
+        for length in set(self._ships):
+            pids = placements.placements(length)
+            self._placement_cells[length] = tf.constant(
+                placements.cell_matrix[pids])
+            self._placement_halos[length] = tf.constant(
+                placements.halo_matrix[pids])
+
+        if seed is None:
+            self._rng = tf.random.Generator.from_non_deterministic_state()
+        else:
+            self._rng = tf.random.Generator.from_seed(seed)
+
+        self._cells = common.create_variable(
+            'cells', UNKNOWN, shape=(batch_size, self._size), dtype=tf.int32)
+        # 0 for water, i + 1 for the i-th ship of the fleet
+        self._ship_ids = common.create_variable(
+            'ship_ids', 0, shape=(batch_size, self._size), dtype=tf.int32)
+        self._hits_left = common.create_variable(
+            'hits_left', 0, shape=(batch_size, len(self._ships)),
+            dtype=tf.int32)
+
+        self._step_type = common.create_variable(
+            'step_type', ts.StepType.FIRST, shape=(batch_size,),
+            dtype=tf.int32)
+        self._reward = common.create_variable(
+            'reward', 0, shape=(batch_size,), dtype=tf.float32)
+        self._discount = common.create_variable(
+            'discount', 1, shape=(batch_size,), dtype=tf.float32)
+        self._episode_steps = common.create_variable(
+            'episode_steps', 0, shape=(batch_size,), dtype=tf.int32)
+
+        self._reset()
+
+    def _sample_ship_ids(self):
+
+        # Draws a fleet for every board: each ship picks uniformly among the
+        # placements clear of the halos of the ships before it. Boards that
+        # run out of placements are drawn again.
+
+        def place(ship_ids, failed):
+
+            forbidden = tf.zeros((self._batch_size, self._size))
+            placed = tf.zeros((self._batch_size, self._size), dtype=tf.int32)
+            stuck = tf.zeros((self._batch_size,), dtype=tf.bool)
+
+            for ship, length in enumerate(self._ships):
+                cells = self._placement_cells[length]
+                legal = tf.matmul(forbidden, cells, transpose_b=True) == 0
+                stuck |= ~tf.reduce_any(legal, axis=1)
+
+                logits = tf.where(legal, 0.0, -np.inf)
+                # Keeps the draw defined for stuck boards, which are
+                # thrown away anyway
+                logits = tf.where(stuck[:, None], 0.0, logits)
+                pids = tf.random.stateless_categorical(
+                    logits, 1, seed=self._rng.make_seeds(1)[:, 0])[:, 0]
+
+                placed += tf.cast(tf.gather(cells, pids), tf.int32) * (ship + 1)
+                forbidden = tf.minimum(
+                    forbidden + tf.gather(self._placement_halos[length], pids),
+                    1.0)
+
+            ship_ids = tf.where(failed[:, None], placed, ship_ids)
+            return ship_ids, failed & stuck
+
+        ship_ids, _ = tf.while_loop(
+            lambda ship_ids, failed: tf.reduce_any(failed),
+            place,
+            (tf.zeros((self._batch_size, self._size), dtype=tf.int32),
+             tf.ones((self._batch_size,), dtype=tf.bool)),
+            maximum_iterations=MAX_PLACEMENT_ATTEMPTS
+            )
+
+        return ship_ids
+
+    def _reset_boards(self, boards):
+
+        # Starts new games on the boards where the mask is set
+
+        ship_ids = self._sample_ship_ids()
+        self._ship_ids.assign(tf.where(boards[:, None], ship_ids, self._ship_ids))
+        self._cells.assign(tf.where(boards[:, None], UNKNOWN, self._cells))
+        self._hits_left.assign(tf.where(
+            boards[:, None],
+            tf.constant(self._ships, dtype=tf.int32)[None],
+            self._hits_left
+            ))
+
+    def _current_time_step(self):
+
+        observation = tf_encode(
+            tf.reshape(self._cells, (self._batch_size,) + self._shape),
+            self._encoding)
+
+        if self._observe_legal_actions:
+            observation = {
+                'observation': observation,
+                'legal_actions': tf.cast(self._cells == UNKNOWN, tf.uint8)
+                }
+
+        return ts.TimeStep(
+            step_type=tf.identity(self._step_type),
+            reward=tf.identity(self._reward),
+            discount=tf.identity(self._discount),
+            observation=observation
+            )
+
+    @common.function
+    def _reset(self):
+
+        self._reset_boards(tf.ones((self._batch_size,), dtype=tf.bool))
+
+        self._step_type.assign(
+            tf.fill((self._batch_size,), ts.StepType.FIRST))
+        self._reward.assign(tf.zeros((self._batch_size,)))
+        self._discount.assign(tf.ones((self._batch_size,)))
+        self._episode_steps.assign(tf.zeros((self._batch_size,), dtype=tf.int32))
+
+        return self._current_time_step()
+
+    def _next_free_cells(self, action):
+
+        # Same probing order as PyBattleshipEnv: down the column, then on
+        # to the top of the next column, wrapping around after the last cell
+
+        rows, cols = self._shape
+
+        taken = tf.reshape(
+            tf.transpose(
+                tf.reshape(self._cells, (self._batch_size, rows, cols)),
+                (0, 2, 1)),
+            (self._batch_size, self._size)
+            ) != UNKNOWN
+
+        positions = action % cols * rows + action // cols
+        order = (positions[:, None] + tf.range(self._size)) % self._size
+        free = tf.argmin(
+            tf.cast(tf.gather(taken, order, batch_dims=1), tf.int32),
+            axis=1, output_type=tf.int32)
+        positions = tf.gather(order, free, batch_dims=1)
+
+        return positions % rows * cols + positions // rows
+
+    @common.function(autograph=True)
+    def _step(self, action):
+
+        action = tf.reshape(tf.cast(action, tf.int32), (self._batch_size,))
+
+        # Boards whose episode ended on the previous step start a new game
+        restart = self._step_type == ts.StepType.LAST
+
+        if tf.reduce_any(restart):
+            self._reset_boards(restart)
+
+        playing = ~restart
+        taken = tf.gather(self._cells, action, batch_dims=1) != UNKNOWN
+
+        reward = tf.zeros((self._batch_size,))
+
+        if self._punish_invalid_actions:
+            reward = tf.where(playing & taken, -1.0, reward)
+            shot = playing & ~taken
+        elif self._skip_invalid_actions:
+            action = tf.where(taken, self._next_free_cells(action), action)
+            shot = playing
+        else:
+            shot = playing & ~taken
+
+        ship = tf.gather(self._ship_ids, action, batch_dims=1)
+        hit = shot & (ship > 0)
+
+        target = tf.one_hot(action, self._size, on_value=True, off_value=False)
+        cells = tf.where(
+            target & shot[:, None],
+            tf.where(hit, HIT, MISS)[:, None],
+            self._cells
+            )
+
+        hits_left = self._hits_left - tf.one_hot(
+            ship - 1, len(self._ships), dtype=tf.int32) * tf.cast(
+                hit, tf.int32)[:, None]
+        sunk = hit & (tf.gather(hits_left, tf.maximum(ship - 1, 0), batch_dims=1) == 0)
+
+        cells = tf.where(
+            sunk[:, None] & (self._ship_ids == ship[:, None]), SUNK, cells)
+
+        ended = shot & tf.reduce_all(hits_left == 0, axis=1)
+
+        episode_steps = tf.where(restart, 0, self._episode_steps + 1)
+        last = ended
+        if self._duration is not None:
+            # Truncated episodes keep their discount
+            last |= playing & (episode_steps >= self._duration)
+
+        self._cells.assign(cells)
+        self._hits_left.assign(hits_left)
+        self._episode_steps.assign(episode_steps)
+
+        self._step_type.assign(tf.where(
+            restart,
+            ts.StepType.FIRST,
+            tf.where(last, ts.StepType.LAST, ts.StepType.MID)
+            ))
+        self._reward.assign(tf.where(hit, 1.0, reward))
+        self._discount.assign(tf.where(ended, 0.0, 1.0))
+
+        return self._current_time_step()
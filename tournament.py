@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import json
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+import profiling
+from algorithms import ALGORITHMS
+from board import Board
+from game import StepType, TimeStep
+from placement import placement_table
+
+GAMES_PER_TASK = 250
+PERCENTILES = (5, 25, 50, 75, 95)
+# Orders of magnitude slower per move than the rest, so only played when
+# asked for by name
+SLOW_ALGORITHMS = ("MonteCarlo",)
+
+def _layouts(shape, ships, seed, chunk, count):
+    # Same seeding as board banks: chunk by chunk, so every algorithm gets
+    # the same boards however the tasks are spread over processes
+    placements = placement_table(shape, ships)
+    random_state = np.random.RandomState([seed, chunk])
+    return [placements.sample(ships, random_state) for _ in range(count)]
+
+def _play_chunk(args):
+
+    # Plays count games of one algorithm and returns its shots per game,
+    # the seconds spent deciding, the seconds spent in total and the
+    # phase profiler when profiling
+
+    name, shape, ships, seed, chunk, count, profile = args
+
+    started = time.perf_counter()
+
+    if profile:
+        profiling.enable().clear()
+
+    bot = ALGORITHMS[name](list(ships), shape)
+    board = Board(shape, ships)
+    max_shots = 2 * board.size
+
+    shots = np.zeros(count, dtype=np.int64)
+    thinking = 0.0
+
+    for game, layout in enumerate(_layouts(shape, ships, seed, chunk, count)):
+
+        board.reset(layout)
+        time_step = TimeStep(
+            StepType.FIRST, 0.0, 1.0, board.observation)
+
+        while not board.all_sunk and shots[game] < max_shots:
+            start = time.perf_counter()
+            action = bot.action(time_step)
+            thinking += time.perf_counter() - start
+
+            reward = float(board.shoot(int(action)) > 1)
+            shots[game] += 1
+            time_step = TimeStep(
+                StepType.MID, reward, 1.0, board.observation)
+
+        # Lets the bot start over for the next game
+        bot.action(TimeStep(StepType.LAST, 0.0, 0.0, board.observation))
+
+    if hasattr(bot, "close"):
+        bot.close()
+
+    return (name, chunk, shots, thinking, time.perf_counter() - started,
+            profiling.disable())
+
+def summarize(shots, thinking, seconds):
+
+    shots = np.asarray(shots)
+    mean = float(shots.mean())
+    # Normal approximation, fine for the thousands of games a run plays
+    half_width = 1.96 * float(shots.std(ddof=1)) / np.sqrt(len(shots)) \
+        if len(shots) > 1 else float("nan")
+
+    return {
+        "games": len(shots),
+        "mean": mean,
+        "std": float(shots.std()),
+        "ci95": [mean - half_width, mean + half_width],
+        "percentiles": {
+            str(q): float(value)
+            for q, value in zip(PERCENTILES, np.percentile(shots, PERCENTILES))
+            },
+        "min": int(shots.min()),
+        "max": int(shots.max()),
+        # Per process, so it doesn't depend on how many ran side by side
+        "games_per_second": len(shots) / seconds,
+        "us_per_move": thinking / shots.sum() * 1e6,
+        }
+
+def run_tournament(
+        names=None, games=10_000,
+        shape=(10, 10), ships=(5, 4, 3, 3, 2),
+        seed=0, processes=None, profile=False):
+
+    # Plays games boards with every named algorithm (all but the slow ones
+    # by default), the same boards for each, and returns a summary per
+    # name. With profile, summaries also hold the time per phase (see
+    # profiling.py).
+
+    if names is None:
+        names = [name for name in ALGORITHMS if name not in SLOW_ALGORITHMS]
+    names = list(names)
+    shape = tuple(shape)
+    ships = tuple(int(ship) for ship in ships)
+
+    tasks = [
+        (name, shape, ships, seed, chunk, min(GAMES_PER_TASK, games - start),
+         profile)
+        for name in names
+        for chunk, start in enumerate(range(0, games, GAMES_PER_TASK))
+        ]
+
+    shots = {name: {} for name in names}
+    thinking = dict.fromkeys(names, 0.0)
+    seconds = dict.fromkeys(names, 0.0)
+    profilers = {name: profiling.PhaseProfiler() for name in names}
+
+    started = time.perf_counter()
+
+    with multiprocessing.Pool(processes) as pool:
+        for name, chunk, chunk_shots, chunk_thinking, chunk_seconds, \
+                profiler in pool.imap_unordered(_play_chunk, tasks):
+            shots[name][chunk] = chunk_shots
+            thinking[name] += chunk_thinking
+            seconds[name] += chunk_seconds
+            if profiler is not None:
+                profilers[name].merge(profiler)
+
+    results = {
+        "shape": list(shape),
+        "ships": list(ships),
+        "seed": seed,
+        "wall_seconds": time.perf_counter() - started,
+        "algorithms": {},
+        }
+
+    for name in names:
+        name_shots = np.concatenate(
+            [shots[name][chunk] for chunk in sorted(shots[name])])
+        results["algorithms"][name] = summarize(
+            name_shots, thinking[name], seconds[name])
+        if profile:
+            results["algorithms"][name]["phases"] = profilers[name].summary()
+
+    return results
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Plays the algorithms against the same seeded boards")
+    parser.add_argument("algorithms", nargs="*", default=None,
+                        help=f"any of {', '.join(ALGORITHMS)} "
+                             f"(default: all but {', '.join(SLOW_ALGORITHMS)})")
+    parser.add_argument("--games", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--shape", type=int, nargs=2, default=(10, 10))
+    parser.add_argument("--ships", type=int, nargs="+", default=(5, 4, 3, 3, 2))
+    parser.add_argument("--output", default=os.path.join(
+        "..", "TFBattleship_DATA", "tournament.json"))
+    parser.add_argument("--profile", action="store_true",
+                        help="time the phases of every move")
+    args = parser.parse_args()
+
+    results = run_tournament(
+        args.algorithms or None, args.games, args.shape, args.ships,
+        args.seed, args.processes, args.profile)
+
+    for name, summary in results["algorithms"].items():
+        low, high = summary["ci95"]
+        print(f"{name:>12}: {summary['mean']:.2f} shots "
+              f"(95% CI {low:.2f}-{high:.2f}, "
+              f"median {summary['percentiles']['50']:.0f}), "
+              f"{summary['games_per_second']:.0f} games/s, "
+              f"{summary['us_per_move']:.0f} us/move")
+        if "phases" in summary:
+            profiler = profiling.PhaseProfiler()
+            for phase, row in summary["phases"].items():
+                profiler.calls[phase] = row["calls"]
+                profiler.nanoseconds[phase] = row["nanoseconds"]
+            print(profiler.report())
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
@@ -25,6 +25,10 @@ class Game:
         self.w = 600
         self.h = 600
 
+        # x runs along the first axis of the board, y along the second
+        self.rows, self.cols = (
+            int(size) for size in env.observation_spec().shape[-2:])
+
         pygame.init()
 
     def main(self):
@@ -39,11 +43,13 @@ class Game:
             except AttributeError:
                 return ts.observation
 
+        rows, cols = self.rows, self.cols
+
         line_x_width = self.w / 200
         line_y_width = self.h / 200
 
-        field_x_width = (self.w - line_x_width * 11) / 10
-        field_y_width = (self.h - line_y_width * 11) / 10
+        field_x_width = (self.w - line_x_width * (rows + 1)) / rows
+        field_y_width = (self.h - line_y_width * (cols + 1)) / cols
 
         win = pygame.display.set_mode((self.w, self.h),  pygame.RESIZABLE)
         surface = win.copy()
@@ -73,14 +79,14 @@ class Game:
                         line_x_width = self.w / 200
                         line_y_width = self.h / 200
 
-                        field_x_width = (self.w - line_x_width * 11) / 10
-                        field_y_width = (self.h - line_y_width * 11) / 10
+                        field_x_width = (self.w - line_x_width * (rows + 1)) / rows
+                        field_y_width = (self.h - line_y_width * (cols + 1)) / cols
 
                         surface = win.copy()
 
                 surface.fill(self.BACKGROUND_COLOR)
 
-                for x in range(11):
+                for x in range(rows + 1):
                     pygame.draw.rect(
                         surface=surface,
                         color=self.LINE_COLOR,
@@ -92,7 +98,7 @@ class Game:
                         )
                     )
 
-                for y in range(11):
+                for y in range(cols + 1):
                     pygame.draw.rect(
                         surface=surface,
                         color=self.LINE_COLOR,
@@ -111,8 +117,8 @@ class Game:
                     mouse[1] - (win.get_height()-self.h)/2
                     ]
 
-                for x in range(10):
-                    for y in range(10):
+                for x in range(rows):
+                    for y in range(cols):
 
                         if (x + 1) * line_x_width + x * field_x_width <= mouse[0] <= \
                             (x+1) * line_x_width + (x+1) * field_x_width and \
@@ -166,8 +172,8 @@ class Game:
 
                 if event.type == pygame.MOUSEBUTTONDOWN:
                     if event.button == 1:
-                        for x in range(10):
-                            for y in range(10):
+                        for x in range(rows):
+                            for y in range(cols):
 
                                 if (x + 1) * line_x_width + x * field_x_width <= mouse[0] <= \
                                     (x+1) * line_x_width + (x+1) * field_x_width and \
@@ -193,10 +199,10 @@ class Game:
 
 
 if __name__ == "__main__":
-    from env import PyBattleshipEnv
+    from game import BattleshipGame
     import pickle
     import time
-    game = Game(PyBattleshipEnv())
+    game = Game(BattleshipGame())
     scores = game.main()
     if scores:
         print("Number of games played: ",